@@ -1,11 +1,36 @@
+import asyncio
 import json
+from pathlib import Path
+
+import re
+from datetime import timedelta
+from functools import partial
 
 import pytest
 import requests
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
 from django.http import JsonResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient
 
-from shops.models import Shop
-from shops.views import AccountRegister
+from shops.catalog import PAGE_FIELDS
+from shops.checkout import CheckoutError, checkout
+from shops.export import get_export_offers
+from shops.feed import get_feed_lag, get_partner_feed
+from shops.importer import PriceListImporter, iter_json, iter_price_list, iter_yaml
+from shops.mail import drain_outbox, queue_email
+from shops.offers import refresh_best_offers
+from shops.orders import get_archived_orders, get_basket_orders, get_partner_orders, get_user_orders
+from shops.models import ArchivedOrder, ArchivedOrderItem, BestOffer, Category, Contact, InfoProduct, Order, \
+    OrderItem, Product, Shop, StockReservation, User, update_order_totals
+from shops.reservations import confirm_order, create_reservations, get_reservation_ttl, \
+    release_expired_reservations
+from shops.tokens import issue_token
+from shops.views import AccountRegister, InfoProductView, OrderEvents
 
 
 def test_post_ar():
@@ -33,6 +58,21 @@ def test_post_login():
     assert response.status_code == 200
 
 
+FIXTURES = Path(__file__).resolve().parent.parent / 'shops' / 'fixtures'
+
+
+def test_iter_price_list():
+    with open(FIXTURES / 'shop1.yaml', 'rb') as f:
+        yaml_rows = list(iter_yaml(f))
+    with open(FIXTURES / 'shop1.json', 'rb') as f:
+        json_rows = list(iter_json(f))
+    for rows in (yaml_rows, json_rows):
+        goods = [value for key, value in rows if key == 'goods']
+        assert ('shop', 'Связной') in rows
+        assert len(goods) == 4
+        assert goods[0]['id'] == 4216292
+
+
 def test_example():
     pass
 
@@ -44,4 +84,317 @@ def test_shop_create():
         user="dodo",
         status=True
     )
-    assert shop.name == "mmm"
\ No newline at end of file
+    assert shop.name == "mmm"
+
+
+def get_hot_queries(user_id, shop_user_id, order_id, offer):
+    """запросы горячего пути: те же функции и методы, что вызывают представления"""
+    def offers(**params):
+        view = InfoProductView()
+        view.request = Request(RequestFactory().get('/', params))
+        return partial(list, view.get_offers().values(*PAGE_FIELDS)[:20])
+
+    # полный каталог без фильтров читается по первичному ключу страницами, его не проверяем
+    return {
+        'basket': partial(list, get_basket_orders(user_id)),
+        'orders': partial(list, get_user_orders(user_id)),
+        'order totals': partial(update_order_totals, [order_id]),
+        'archive': partial(list, get_archived_orders(user_id)),
+        'shop catalog': offers(shop_id=offer.shop_id),
+        'category catalog': offers(category_id=offer.product.category_id),
+        'partner orders': partial(list, get_partner_orders(shop_user_id)),
+    }
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return '\n'.join(row[-1] for row in cursor.fetchall())
+
+
+@pytest.mark.django_db
+def test_hot_path_queries_use_indexes():
+    if connection.vendor != 'sqlite':
+        pytest.skip('планы запросов проверяем на SQLite')
+    partner, offers = create_offers([5, 5])
+    order = create_new_order(offers)
+    basket = Order.objects.create(user=order.user, status='basket')
+    OrderItem.objects.create(order=basket, info_product=offers[0], quantity=1, price=100)
+    archived = ArchivedOrder.objects.create(id=order.id + 100, user=order.user, data_time=timezone.now(),
+                                            status='Delivered', updated_at=timezone.now())
+    ArchivedOrderItem.objects.create(order=archived, info_product_id=offers[0].id, shop_id=offers[0].shop_id,
+                                     name='Телефон', model='m', quantity=1, price=100, total_cost=100)
+
+    scans = {}
+    for name, run in get_hot_queries(order.user_id, partner.id, order.id, offers[0]).items():
+        # каждый запрос, включая prefetch_related, проверяем в том виде, в каком его выполнил Django
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        for query in queries:
+            plan = explain(query['sql'])
+            if re.search(r'\bSCAN (?:TABLE )?\w+', plan):
+                scans.setdefault(name, []).append((query['sql'], plan))
+    assert not scans, scans
+
+
+class CountingEmailBackend(BaseEmailBackend):
+    """как SMTP: без открытого соединения send_messages открывает и закрывает своё"""
+    opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connection = None
+
+    def open(self):
+        if self.connection:
+            return False
+        CountingEmailBackend.opened += 1
+        self.connection = True
+        return True
+
+    def close(self):
+        self.connection = None
+
+    def send_messages(self, messages):
+        new_connection = self.open()
+        if new_connection:
+            self.close()
+        return len(messages)
+
+
+@pytest.mark.django_db
+def test_outbox_batch_shares_connection(settings):
+    settings.EMAIL_BACKEND = f'{__name__}.CountingEmailBackend'
+    CountingEmailBackend.opened = 0
+    for number in range(3):
+        queue_email('Тема', 'Текст', f'user{number}@example.com')
+    assert drain_outbox(batch_size=10)['sent'] == 3
+    assert CountingEmailBackend.opened == 1
+
+
+@pytest.mark.django_db
+def test_partner_feed_waits_for_uncommitted_changes():
+    partner = User.objects.create_user(email='shop@example.com', username='shop', password='x', type='shop')
+    buyer = User.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+    shop = Shop.objects.create(name='Связной', user=partner)
+    product = Product.objects.create(name='Телефон', category=Category.objects.create(name='Смартфоны'))
+    offer = InfoProduct.objects.create(product=product, shop=shop, model='m', quantity=5, price=100,
+                                       suggested_retail_price=110)
+    order = Order.objects.create(user=buyer, status='New')
+    OrderItem.objects.create(order=order, info_product=offer, quantity=1, price=100)
+    now = timezone.now()
+
+    # только что записанное изменение могло ещё не закоммититься - курсор его не обгоняет
+    orders, since, _ = get_partner_feed(partner.id, now=now)
+    assert orders == [] and since is None
+
+    orders, since, _ = get_partner_feed(partner.id, now=now + get_feed_lag() + timedelta(seconds=1))
+    assert [item.id for item in orders] == [order.id]
+    assert get_partner_feed(partner.id, since, now=now + get_feed_lag() * 2)[0] == []
+
+
+def create_offers(quantities, username='shop'):
+    """магазин пользователя username с предложениями разных продуктов с указанными остатками"""
+    partner = User.objects.create_user(email=f'{username}@example.com', username=username, password='x', type='shop')
+    shop = Shop.objects.create(name=username, user=partner)
+    category = Category.objects.get_or_create(name='Смартфоны')[0]
+    return partner, [InfoProduct.objects.create(
+        product=Product.objects.create(name=f'{username} {number}', category=category), shop=shop, model='m',
+        quantity=quantity, price=100, suggested_retail_price=110) for number, quantity in enumerate(quantities)]
+
+
+def create_new_order(offers, quantity=2, username='buyer'):
+    """оформленный заказ: остаток уже списан, на позиции записаны резервы"""
+    buyer = User.objects.create_user(email=f'{username}@example.com', username=username, password='x')
+    order = Order.objects.create(user=buyer, status='New')
+    create_reservations(order.id, [OrderItem.objects.create(order=order, info_product=offer, quantity=quantity,
+                                                            price=100) for offer in offers])
+    return order
+
+
+@pytest.mark.django_db
+def test_release_returns_stock_of_order_larger_than_batch():
+    _, offers = create_offers([3, 3, 3])
+    order = create_new_order(offers)
+
+    result = release_expired_reservations(batch_size=2, now=timezone.now() + get_reservation_ttl())
+    assert result == {'released': 3, 'reclaimed': 6}
+    assert [offer.quantity for offer in InfoProduct.objects.order_by('id')] == [5, 5, 5]
+    assert Order.objects.get(id=order.id).status == 'Canceled'
+
+
+@pytest.mark.django_db
+def test_confirm_order_waits_for_every_shop():
+    first, first_offers = create_offers([3], 'shop1')
+    second, second_offers = create_offers([3], 'shop2')
+    order = create_new_order(first_offers + second_offers)
+
+    # подтверждение снимает только резервы своего магазина
+    assert confirm_order(first.id, order.id)
+    assert Order.objects.get(id=order.id).status == 'New'
+    assert list(StockReservation.objects.values_list('info_product_id', flat=True)) == [second_offers[0].id]
+
+    assert confirm_order(second.id, order.id)
+    assert Order.objects.get(id=order.id).status == 'Confirmed'
+    assert release_expired_reservations(now=timezone.now() + get_reservation_ttl())['reclaimed'] == 0
+    assert [offer.quantity for offer in InfoProduct.objects.order_by('id')] == [3, 3]
+
+
+@pytest.mark.django_db
+def test_order_views_query_count_does_not_grow_with_items():
+    partner, offers = create_offers([5] * 6)
+    order = create_new_order(offers[:2])
+    basket = Order.objects.create(user=order.user, status='basket')
+    OrderItem.objects.create(order=basket, info_product=offers[0], quantity=1, price=100)
+
+    def count_queries():
+        counts = []
+        for user, url in ((order.user, '/api/v1/basket'), (order.user, '/api/v1/order'),
+                          (partner, '/api/v1/partner/orders')):
+            client = APIClient()
+            client.force_authenticate(user)
+            with CaptureQueriesContext(connection) as queries:
+                assert client.get(url).status_code == 200
+            counts.append(len(queries))
+        return counts
+
+    before = count_queries()
+    for offer in offers[2:]:
+        OrderItem.objects.create(order=order, info_product=offer, quantity=1, price=100)
+        OrderItem.objects.create(order=basket, info_product=offer, quantity=1, price=100)
+    assert count_queries() == before
+
+
+def test_order_events_stream_ends_after_lifetime():
+    view = OrderEvents(stream_lifetime=0.2, keepalive=0.1)
+
+    async def read_stream():
+        return [chunk async for chunk in view.stream('test-channel')]
+
+    chunks = asyncio.run(asyncio.wait_for(read_stream(), 2))
+    assert chunks[0].startswith(f'retry: {view.retry}\n')
+    assert all(chunk == ': keepalive\n\n' for chunk in chunks[1:])
+
+
+def create_basket(offers, quantity=2):
+    """корзина покупателя с позициями по предложениям и его контакт"""
+    buyer = User.objects.create_user(email='buyer@example.com', username='buyer', password='x')
+    contact = Contact.objects.create(user=buyer, city='Москва', street='Тверская', phone='+70000000000')
+    basket = Order.objects.create(user=buyer, status='basket')
+    for offer in offers:
+        OrderItem.objects.create(order=basket, info_product=offer, quantity=quantity, price=offer.price)
+    return basket, contact
+
+
+def get_stock():
+    return list(InfoProduct.objects.order_by('id').values_list('quantity', flat=True))
+
+
+@pytest.mark.django_db
+def test_checkout_replay_with_same_key(django_capture_on_commit_callbacks):
+    _, offers = create_offers([5, 5])
+    refresh_best_offers([offer.product_id for offer in offers])
+    basket, contact = create_basket(offers)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        order, created = checkout(basket.user_id, basket.id, contact.id, key='key-1')
+    assert created and order.status == 'New' and order.total_sum == 400
+    assert get_stock() == [3, 3]
+    # лучшее предложение видит остаток после оформления
+    assert BestOffer.objects.get(product_id=offers[0].product_id).quantity == 3
+
+    assert checkout(basket.user_id, basket.id, contact.id, key='key-1') == (order, False)
+    assert get_stock() == [3, 3]
+    with pytest.raises(CheckoutError, match='Заказ уже оформлен'):
+        checkout(basket.user_id, basket.id, contact.id)
+
+
+@pytest.mark.django_db
+def test_checkout_without_stock_keeps_basket():
+    _, offers = create_offers([5, 1])
+    basket, contact = create_basket(offers)
+
+    with pytest.raises(CheckoutError) as error:
+        checkout(basket.user_id, basket.id, contact.id)
+    assert error.value.items == {offers[1].id: 'Доступно 1'}
+    assert Order.objects.get(id=basket.id).status == 'basket'
+    assert basket.ordered_items.count() == 2
+    assert get_stock() == [5, 1]
+    assert not StockReservation.objects.exists()
+
+
+@pytest.mark.django_db
+def test_checkout_rejects_unpublished_offer():
+    _, offers = create_offers([5])
+    # предложение загружается в следующую версию каталога, она ещё не опубликована
+    InfoProduct.objects.filter(id=offers[0].id).update(version=1)
+    basket, contact = create_basket(offers)
+
+    with pytest.raises(CheckoutError) as error:
+        checkout(basket.user_id, basket.id, contact.id)
+    assert error.value.items == {offers[0].id: 'Товар недоступен'}
+    assert get_stock() == [5]
+
+
+@pytest.mark.django_db
+def test_sync_import_hides_removed_ordered_offers(tmp_path):
+    partner = User.objects.create_user(email='shop@example.com', username='shop', password='x', type='shop')
+    with open(FIXTURES / 'shop1.yaml', 'rb') as f:
+        PriceListImporter(partner.id).run(iter_price_list(f))
+    offers = list(InfoProduct.objects.order_by('external_id'))
+    ordered, in_basket = offers[0], offers[1]
+    order = create_new_order([ordered])
+    basket = Order.objects.create(user=order.user, status='basket')
+    for offer in (ordered, in_basket):
+        OrderItem.objects.create(order=basket, info_product=offer, quantity=1, price=offer.price)
+
+    # в новом прайсе нет ни заказанного товара, ни товара из корзины
+    price_list = (FIXTURES / 'shop1.yaml').read_text(encoding='utf-8')
+    for offer in (ordered, in_basket):
+        start = price_list.index(f'  - id: {offer.external_id}')
+        end = price_list.find('  - id:', start + 1)
+        price_list = price_list[:start] + (price_list[end:] if end != -1 else '')
+    (tmp_path / 'shop1.yaml').write_text(price_list, encoding='utf-8')
+    with open(tmp_path / 'shop1.yaml', 'rb') as f:
+        assert PriceListImporter(partner.id).run(iter_price_list(f))['removed'] == 2
+
+    assert set(get_export_offers().values_list('id', flat=True)) == {offer.id for offer in offers[2:]}
+    assert list(order.ordered_items.values_list('info_product_id', flat=True)) == [ordered.id]
+    assert not InfoProduct.objects.filter(id=in_basket.id).exists()
+    basket.refresh_from_db()
+    assert basket.ordered_items.count() == 0 and basket.total_sum == 0
+
+
+def token_client():
+    """клиент с токеном входа, первый запрос уже положил владельца токена в кэш"""
+    user = User.objects.create_user(email='token@example.com', username='token', password='x')
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(user).key}')
+    assert client.get('/api/v1/user/details').status_code == 200
+    return user, client
+
+
+@pytest.mark.django_db
+def test_cached_token_rotation():
+    _, client = token_client()
+    response = client.post('/api/v1/user/token/rotate')
+    assert response.status_code == 200
+    assert client.get('/api/v1/user/details').status_code == 401
+
+    client.credentials(HTTP_AUTHORIZATION=f'Token {response.json()["Token"]}')
+    assert client.get('/api/v1/user/details').status_code == 200
+
+
+@pytest.mark.django_db
+def test_cached_token_of_deactivated_user():
+    user, client = token_client()
+    user.is_active = False
+    user.save()
+    assert client.get('/api/v1/user/details').status_code == 401
+
+
+@pytest.mark.django_db
+def test_cached_token_expiry(settings):
+    _, client = token_client()
+    settings.AUTH_TOKEN_TTL = 0
+    assert client.get('/api/v1/user/details').status_code == 401
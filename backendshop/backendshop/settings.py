@@ -153,6 +153,19 @@ STATIC_URL = '/static/'
 
 STORAGE = os.path.join(BASE_DIR, 'storage')
 
+IMPORT_BATCH_SIZE = 1000
+IMPORT_SHARD_SIZE = 10000
+
+# срок резерва товара под неподтверждённый заказ, секунды: за это время магазин
+# подтверждает заказ через partner/orders, иначе заказ отменяется, а товар возвращается
+# на склад. Подтверждают вручную, поэтому срок - сутки, с запасом на нерабочие часы
+RESERVATION_TTL = 24 * 60 * 60
+RESERVATION_BATCH_SIZE = 1000
+
+# доставленные и отменённые заказы старше срока (дни) переносятся в архив
+ORDER_ARCHIVE_DAYS = 180
+ORDER_ARCHIVE_BATCH_SIZE = 500
+
 
 AUTH_USER_MODEL = 'shops.User'
 
@@ -169,6 +182,13 @@ EMAIL_PORT = '465'
 EMAIL_USE_SSL = True
 SERVER_EMAIL = EMAIL_HOST_USER
 
+# очередь писем: размер пачки, лимит писем в минуту на почтовый сервер, число попыток
+EMAIL_BATCH_SIZE = 100
+EMAIL_RATE_LIMIT = 600
+EMAIL_MAX_ATTEMPTS = 5
+# окно, за которое изменения статусов заказов собираются в одно письмо, секунды
+NOTIFICATION_WINDOW = 5 * 60
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 40,
@@ -180,18 +200,18 @@ REST_FRAMEWORK = {
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'shops.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'shops.throttling.ScopedCounterThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',
         'user': '1000/day',
         'partner': '10/day',
+        'export': '60/hour',
     }
 }
 
@@ -200,4 +220,51 @@ REDIS_HOST = 'localhost'
 REDIS_PORT = '6379'
 CELERY_BROKER_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/0'
 BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
-CELERY_RESULT_BACKEND = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/0'
\ No newline at end of file
+CELERY_RESULT_BACKEND = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/0'
+CELERY_BEAT_SCHEDULE = {
+    'release-expired-reservations': {
+        'task': 'shops.tasks.release_reservations',
+        'schedule': 60,
+    },
+    'drain-email-outbox': {
+        'task': 'shops.tasks.drain_email_outbox',
+        'schedule': 30,
+    },
+    'purge-expired-tokens': {
+        'task': 'shops.tasks.purge_tokens',
+        'schedule': 60 * 60,
+    },
+    'archive-old-orders': {
+        'task': 'shops.tasks.archive_old_orders',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
+# общий кэш в Redis, тесты подменяют его настройками django_testing.settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/1',
+    }
+}
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# пользователь по токену: срок в общем кэше и в памяти процесса, секунды; размер LRU процесса
+TOKEN_CACHE_TIMEOUT = 5 * 60
+TOKEN_CACHE_LOCAL_TIMEOUT = 10
+TOKEN_CACHE_SIZE = 10000
+
+# срок действия токенов входа и подтверждения почты, секунды
+AUTH_TOKEN_TTL = 30 * 24 * 60 * 60
+CONFIRM_EMAIL_TOKEN_TTL = 24 * 60 * 60
+TOKEN_PURGE_BATCH_SIZE = 1000
+
+# строк на пачку при потоковой выгрузке каталога
+EXPORT_CHUNK_SIZE = 2000
+
+# лента заказов магазина отдаёт изменения старше этого срока, секунды: он должен быть
+# больше самой долгой транзакции, меняющей заказы, иначе курсор обгонит незакоммиченное изменение
+PARTNER_FEED_LAG = 10
+
+# pub/sub для push-канала статусов заказов, без него - каналы в памяти процесса
+ORDER_EVENTS_URL = 'redis://' + REDIS_HOST + ':' + REDIS_PORT + '/2'
@@ -0,0 +1,15 @@
+"""
+Настройки для тестов (pytest.ini): кэш и каналы событий в памяти процесса,
+задачи Celery выполняются сразу, без брокера.
+"""
+from backendshop.settings import *  # noqa: F401,F403
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+ORDER_EVENTS_URL = None
+
+CELERY_TASK_ALWAYS_EAGER = True
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 from .models import Shop, Category, Product, Parameter, ProductParameter, \
-    Order, OrderItem, InfoProduct
+    Order, OrderItem, InfoProduct, ImportJob, BestOffer, OutgoingEmail, LoginToken, \
+    ArchivedOrder, ArchivedOrderItem
 
 
 @admin.register(Shop)
@@ -42,3 +43,37 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'status', 'processed', 'created_at', 'finished_at',)
+
+
+@admin.register(BestOffer)
+class BestOfferAdmin(admin.ModelAdmin):
+    list_display = ('product', 'shop', 'price', 'quantity', 'offers',)
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at',)
+    list_filter = ('status',)
+
+
+@admin.register(LoginToken)
+class LoginTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'created',)
+    raw_id_fields = ('user',)
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'data_time', 'total_sum', 'archived_at',)
+    list_filter = ('status',)
+    inlines = (ArchivedOrderItemInline,)
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 
 class ShopConfig(AppConfig):
-    name = 'shops'
\ No newline at end of file
+    name = 'shops'
+
+    def ready(self):
+        from . import signals  # noqa: F401
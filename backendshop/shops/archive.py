@@ -0,0 +1,69 @@
+"""
+Архив завершённых заказов.
+
+Доставленные и отменённые заказы, которые не менялись ORDER_ARCHIVE_DAYS дней,
+периодическая задача переносит вместе с позициями в shops_archivedorder и
+shops_archivedorderitem. Позиции сохраняются снимком (название, модель, магазин),
+без ссылок на каталог. Заказы выбираются по индексу на updated_at пачками по
+ORDER_ARCHIVE_BATCH_SIZE, каждая пачка - отдельная короткая транзакция, поэтому
+рабочие таблицы заказов и их индексы содержат только актуальные заказы.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ARCHIVE_STATUSES = ('Delivered', 'Canceled')
+DEFAULT_ORDER_ARCHIVE_DAYS = 180
+DEFAULT_ORDER_ARCHIVE_BATCH_SIZE = 500
+
+ORDER_FIELDS = ('id', 'user_id', 'contact_id', 'data_time', 'status', 'total_sum', 'total_quantity', 'items_count',
+                'updated_at')
+
+
+def get_archive_cutoff(now=None):
+    days = getattr(settings, 'ORDER_ARCHIVE_DAYS', DEFAULT_ORDER_ARCHIVE_DAYS)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_batch(cutoff, batch_size):
+    """переносим одну пачку заказов, возвращаем число перенесённых заказов и позиций"""
+    with transaction.atomic():
+        orders = list(Order.objects.select_for_update(skip_locked=True).filter(
+            status__in=ARCHIVE_STATUSES, updated_at__lt=cutoff).order_by('updated_at', 'id').values(
+            *ORDER_FIELDS)[:batch_size])
+        if not orders:
+            return 0, 0
+        ids = [order['id'] for order in orders]
+        items = [ArchivedOrderItem(order_id=item['order_id'],
+                                   info_product_id=item['info_product_id'],
+                                   shop_id=item['info_product__shop_id'],
+                                   name=item['info_product__product__name'],
+                                   model=item['info_product__model'],
+                                   quantity=item['quantity'],
+                                   price=item['price'],
+                                   total_cost=item['total_cost'])
+                 for item in OrderItem.objects.filter(order_id__in=ids).order_by('id').values(
+                     'order_id', 'info_product_id', 'info_product__shop_id', 'info_product__product__name',
+                     'info_product__model', 'quantity', 'price', 'total_cost')]
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create(items)
+        Order.objects.filter(id__in=ids).delete()
+    return len(orders), len(items)
+
+
+def archive_orders(batch_size=None, now=None):
+    """переносим в архив все завершённые заказы старше срока, возвращаем число заказов и позиций"""
+    batch_size = batch_size or getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', DEFAULT_ORDER_ARCHIVE_BATCH_SIZE)
+    cutoff = get_archive_cutoff(now)
+    archived = items = 0
+    while True:
+        orders_count, items_count = archive_batch(cutoff, batch_size)
+        archived += orders_count
+        items += items_count
+        if orders_count < batch_size:
+            return {'orders': archived, 'items': items}
@@ -0,0 +1,132 @@
+"""
+Аутентификация по токену без запроса к базе на каждый вызов API.
+
+Пользователь, найденный по токену, хранится в общем кэше на
+TOKEN_CACHE_TIMEOUT секунд и в LRU процесса на TOKEN_CACHE_LOCAL_TIMEOUT
+секунд (не больше TOKEN_CACHE_SIZE записей). Удаление токена и любое
+сохранение пользователя (пароль, is_active, тип) сбрасывают общий кэш и
+LRU своего процесса; LRU остальных процессов устаревает не дольше
+локального срока. Срок действия токена проверяется по дате выдачи из
+кэша, без запроса к базе. Из кэша пользователь восстанавливается с отложенными
+полями: остальные поля догружаются при обращении, save() записывает
+только загруженные.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .models import LoginToken, User
+from .tokens import get_expires
+
+USER_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name', 'type', 'is_active', 'is_staff',
+               'is_superuser')
+DEFAULT_TOKEN_CACHE_TIMEOUT = 5 * 60
+DEFAULT_TOKEN_CACHE_LOCAL_TIMEOUT = 10
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+
+
+def get_option(name, default):
+    return getattr(settings, name, default)
+
+
+def token_key(key):
+    return f'auth-token:{key}'
+
+
+class LocalTokenCache:
+    """ограниченный LRU в памяти процесса со сроком жизни записей"""
+
+    def __init__(self):
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return item[1]
+
+    def set(self, key, values):
+        timeout = get_option('TOKEN_CACHE_LOCAL_TIMEOUT', DEFAULT_TOKEN_CACHE_LOCAL_TIMEOUT)
+        with self.lock:
+            self.items[key] = (time.monotonic() + timeout, values)
+            self.items.move_to_end(key)
+            while len(self.items) > get_option('TOKEN_CACHE_SIZE', DEFAULT_TOKEN_CACHE_SIZE):
+                self.items.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.items.pop(key, None)
+
+
+local_cache = LocalTokenCache()
+
+
+def invalidate_tokens(keys):
+    keys = list(keys)
+    local_cache.delete(keys)
+    cache.delete_many([token_key(key) for key in keys])
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(LoginToken.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    model = LoginToken
+
+    def authenticate_credentials(self, key):
+        values = local_cache.get(key)
+        if values is None:
+            values = cache.get(token_key(key))
+            if values is None:
+                values = self.load_user(key)
+                cache.set(token_key(key), values, self.get_timeout(values))
+            local_cache.set(key, values)
+
+        if values is False:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if get_expires(values['token_created']) <= timezone.now():
+            raise exceptions.AuthenticationFailed('Срок действия токена истёк')
+        if not values['is_active']:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return self.get_user(values), key
+
+    @staticmethod
+    def get_timeout(values):
+        """в общем кэше токен живёт не дольше своего срока действия"""
+        timeout = get_option('TOKEN_CACHE_TIMEOUT', DEFAULT_TOKEN_CACHE_TIMEOUT)
+        if values is False:
+            return timeout
+        left = (get_expires(values['token_created']) - timezone.now()).total_seconds()
+        return max(1, min(timeout, int(left)))
+
+    @staticmethod
+    def load_user(key):
+        """значения USER_FIELDS владельца токена и дата выдачи или False, если токена нет"""
+        values = LoginToken.objects.filter(key=key).values(
+            'created', *(f'user__{name}' for name in USER_FIELDS)).first()
+        if values is None:
+            return False
+        user = {name: values[f'user__{name}'] for name in USER_FIELDS}
+        user['token_created'] = values['created']
+        return user
+
+    @staticmethod
+    def get_user(values):
+        """пользователь с загруженными USER_FIELDS, from_db ждёт значения в порядке полей модели"""
+        fields = [field.attname for field in User._meta.concrete_fields if field.attname in USER_FIELDS]
+        return User.from_db('default', fields, [values[name] for name in fields])
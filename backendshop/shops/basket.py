@@ -0,0 +1,85 @@
+"""
+Пакетные операции с корзиной: позиции запроса проверяются одним запросом
+к каталогу и записываются одним INSERT ... ON CONFLICT или одним UPDATE,
+по каждой позиции возвращается отдельный результат. Итоги корзины
+пересчитываются в той же транзакции.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import InfoProduct, Order, OrderItem, update_order_totals
+
+
+def get_basket(user_id):
+    basket, _ = Order.objects.get_or_create(user_id=user_id, status='basket')
+    return basket
+
+
+def parse_lines(items, key):
+    """[(номер позиции, id, количество)] и ошибки формата по позициям"""
+    lines = []
+    errors = []
+    for index, item in enumerate(items if isinstance(items, list) else []):
+        pk = item.get(key) if isinstance(item, dict) else None
+        quantity = item.get('quantity', 1) if isinstance(item, dict) else None
+        if type(pk) == int and type(quantity) == int and quantity > 0:
+            lines.append((index, pk, quantity))
+        else:
+            errors.append({'line': index, 'Status': False, 'Error': 'Неверный формат позиции'})
+    return lines, errors
+
+
+def add_items(basket, items):
+    """добавляем позиции или меняем количество уже добавленных"""
+    lines, results = parse_lines(items, 'info_product')
+    prices = dict(InfoProduct.objects.filter(
+        id__in={info_product_id for _, info_product_id, _ in lines},
+        shop__status=True, version=F('shop__catalog_version')).values_list('id', 'price'))
+
+    rows = {}
+    for index, info_product_id, quantity in lines:
+        if info_product_id not in prices:
+            results.append({'line': index, 'info_product': info_product_id, 'Status': False,
+                            'Error': 'Товар не найден'})
+            continue
+        price = prices[info_product_id]
+        rows[info_product_id] = OrderItem(order_id=basket.id, info_product_id=info_product_id, quantity=quantity,
+                                          price=price, total_cost=price * quantity)
+        results.append({'line': index, 'info_product': info_product_id, 'Status': True})
+
+    with transaction.atomic():
+        OrderItem.objects.bulk_create(rows.values(), update_conflicts=True, unique_fields=['order', 'info_product'],
+                                      update_fields=['quantity', 'price', 'total_cost'])
+        update_order_totals([basket.id])
+    return sorted(results, key=lambda result: result['line'])
+
+
+def update_items(basket, items):
+    """меняем количество в позициях корзины по их id"""
+    lines, results = parse_lines(items, 'id')
+    existing = OrderItem.objects.filter(order_id=basket.id).only('id', 'price').in_bulk(
+        {pk for _, pk, _ in lines})
+
+    changed = {}
+    for index, pk, quantity in lines:
+        if pk not in existing:
+            results.append({'line': index, 'id': pk, 'Status': False, 'Error': 'Позиция не найдена'})
+            continue
+        item = existing[pk]
+        item.quantity = quantity
+        item.total_cost = item.price * quantity
+        changed[pk] = item
+        results.append({'line': index, 'id': pk, 'Status': True})
+
+    with transaction.atomic():
+        OrderItem.objects.bulk_update(changed.values(), ['quantity', 'total_cost'])
+        update_order_totals([basket.id])
+    return sorted(results, key=lambda result: result['line'])
+
+
+def delete_items(basket, ids):
+    """удаляем позиции корзины по их id"""
+    with transaction.atomic():
+        deleted = OrderItem.objects.filter(order_id=basket.id, id__in=ids).delete()[0]
+        update_order_totals([basket.id])
+    return deleted
@@ -0,0 +1,50 @@
+"""
+Кэш ответов каталога товаров.
+
+В ключ страницы входит версия каталога: версия магазина для выдачи по магазину
+и общая версия для выдачи по всем магазинам. Загрузка прайса и смена статуса
+магазина увеличивают версии, после чего старые страницы просто не читаются
+и вытесняются кэшем по таймауту.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+ALL_SHOPS = 'all'
+
+
+def version_key(shop_id=ALL_SHOPS):
+    return f'catalog-version:{shop_id}'
+
+
+def get_catalog_version(shop_id=ALL_SHOPS):
+    key = version_key(shop_id)
+    version = cache.get(key)
+    if version is None:
+        # начальная версия от времени, чтобы после вытеснения ключа не прочитать старые страницы
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_catalog_version(shop_id):
+    bump_catalog_versions([shop_id])
+
+
+def bump_catalog_versions(shop_ids):
+    """версии указанных магазинов и общая версия увеличиваются по одному разу"""
+    for key in [version_key(shop_id) for shop_id in set(shop_ids)] + [version_key()]:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def catalog_page_key(shop_id, category_id, page):
+    version = get_catalog_version(shop_id or ALL_SHOPS)
+    return f'catalog-page:{version}:{shop_id}:{category_id}:{page}'
+
+
+def get_catalog_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
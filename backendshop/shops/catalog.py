@@ -0,0 +1,93 @@
+"""
+Быстрая сборка JSON каталога без сериализаторов DRF.
+
+Строки предложений читаются через .values() одним запросом, параметры -
+вторым, из них собираются словари той же структуры, что у
+ProductInfoSerializer, и кодируются ujson. Готовый JSON каждого
+предложения кэшируется с версией прайса и версией каталога магазина в
+ключе, поэтому после загрузки прайса или смены статуса магазина старые
+фрагменты просто не читаются. Лучшее предложение по продукту зависит от
+других магазинов, оно читается вместе со страницей и подставляется в
+фрагмент при каждой сборке.
+"""
+from collections import defaultdict
+from functools import partial
+
+import ujson
+from django.core.cache import cache
+
+from .cache import get_catalog_timeout, get_catalog_version
+from .models import InfoProduct, ProductParameter
+
+OFFER_FIELDS = ('id', 'model', 'shop_id', 'quantity', 'price', 'suggested_retail_price', 'product__name',
+                'product__category__name')
+BEST_OFFER_FIELDS = (('info_product', 'info_product_id'), ('shop', 'shop_id'), ('price', 'price'),
+                     ('quantity', 'quantity'), ('offers', 'offers'))
+# поля страницы: ключ фрагмента и лучшее предложение, в том же запросе, что и пагинация
+PAGE_FIELDS = ('id', 'version', 'shop_id') + tuple(f'product__best_offer__{field}' for _, field in BEST_OFFER_FIELDS)
+# место лучшего предложения в кэшированном фрагменте
+BEST_OFFER_SLOT = '"best_offer":null'
+
+dumps = partial(ujson.dumps, ensure_ascii=False, escape_forward_slashes=False)
+
+
+def fragment_key(offer_id, version, catalog_version):
+    return f'catalog-offer:{catalog_version}:{version}:{offer_id}'
+
+
+def build_fragments(ids):
+    """JSON предложений по id без лучшего предложения"""
+    parameters = defaultdict(list)
+    for info_product_id, name, value in ProductParameter.objects.filter(info_product_id__in=ids).order_by(
+            'id').values_list('info_product_id', 'parameter__name', 'value'):
+        parameters[info_product_id].append({'parameter': name, 'value': value})
+
+    fragments = {}
+    for row in InfoProduct.objects.filter(id__in=ids).order_by().values(*OFFER_FIELDS):
+        fragments[row['id']] = dumps({
+            'id': row['id'],
+            'model': row['model'],
+            'product': {
+                'name': row['product__name'],
+                'category': row['product__category__name'],
+                'best_offer': None,
+            },
+            'shop': row['shop_id'],
+            'quantity': row['quantity'],
+            'price': row['price'],
+            'price_rrc': row['suggested_retail_price'],
+            'product_parameters': parameters[row['id']],
+        })
+    return fragments
+
+
+def render_offers(offers):
+    """JSON-строки предложений страницы в её порядке, offers - строки PAGE_FIELDS"""
+    offers = list(offers)
+    catalog_versions = {shop_id: get_catalog_version(shop_id) for shop_id in {offer['shop_id'] for offer in offers}}
+    keys = {offer['id']: fragment_key(offer['id'], offer['version'], catalog_versions[offer['shop_id']])
+            for offer in offers}
+    cached = cache.get_many(keys.values())
+    fragments = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in keys if pk not in fragments]
+    if missing:
+        built = build_fragments(missing)
+        cache.set_many({keys[pk]: fragment for pk, fragment in built.items()}, get_catalog_timeout())
+        fragments.update(built)
+
+    rendered = []
+    for offer in offers:
+        best_offer = None
+        if offer['product__best_offer__info_product_id'] is not None:
+            best_offer = {name: offer[f'product__best_offer__{field}'] for name, field in BEST_OFFER_FIELDS}
+        rendered.append(fragments[offer['id']].replace(BEST_OFFER_SLOT, '"best_offer":' + dumps(best_offer), 1))
+    return rendered
+
+
+def render_page(envelope, offers):
+    """ответ пагинации: поля envelope и results из готовых фрагментов"""
+    envelope = dumps(envelope)
+    results = '"results":[' + ','.join(render_offers(offers)) + ']'
+    if envelope == '{}':
+        return '{' + results + '}'
+    return envelope[:-1] + ',' + results + '}'
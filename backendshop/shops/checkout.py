@@ -0,0 +1,94 @@
+"""
+Оформление заказа из корзины.
+
+Всё выполняется в одной транзакции: блокируется заказ, затем строки предложений
+в порядке id (одинаковый порядок у всех покупателей исключает взаимные
+блокировки), остаток списывается, цены фиксируются в позициях заказа.
+SQLite не поддерживает SELECT ... FOR UPDATE, поэтому списание всегда
+выполняется условным UPDATE quantity >= N: если остаток успели забрать,
+транзакция откатывается. Повтор запроса с тем же ключом возвращает уже
+оформленный заказ без повторного списания. Списанный остаток
+записывается в резерв, который снимается, если заказ не подтвердят. После
+коммита пересчитываются лучшие предложения и сбрасывается кэш каталога.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .events import notify_orders
+from .models import Contact, InfoProduct, Order, update_order_totals
+from .notifications import notify_status_changes
+from .offers import refresh_stock
+from .reservations import create_reservations
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, items=None):
+        super().__init__(message)
+        self.message = message
+        self.items = items or {}
+
+
+def get_locked_offers(info_product_ids):
+    return {offer.id: offer for offer in InfoProduct.objects.select_for_update(of=('self',)).filter(
+        id__in=info_product_ids).select_related('shop').order_by('id')}
+
+
+def reserve_stock(items):
+    """списываем остаток по позициям в порядке id предложений"""
+    for item in sorted(items, key=lambda item: item.info_product_id):
+        if not InfoProduct.objects.filter(id=item.info_product_id, quantity__gte=item.quantity).update(
+                quantity=F('quantity') - item.quantity):
+            raise CheckoutError('Недостаточно товара', {item.info_product_id: 'Недостаточно товара'})
+
+
+def checkout(user_id, order_id, contact_id, key=None):
+    """
+    Оформляем корзину. Возвращает (заказ, создан ли он этим вызовом),
+    при нехватке товара или неверных данных поднимает CheckoutError.
+    """
+    if key:
+        order = Order.objects.filter(user_id=user_id, checkout_key=key).exclude(status='basket').first()
+        if order:
+            return order, False
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(id=order_id, user_id=user_id).first()
+        if order is None:
+            raise CheckoutError('Заказ не найден')
+        if order.status != 'basket':
+            if key and order.checkout_key == key:
+                return order, False
+            raise CheckoutError('Заказ уже оформлен')
+        if not Contact.objects.filter(id=contact_id, user_id=user_id).exists():
+            raise CheckoutError('Контакт не найден')
+
+        items = list(order.ordered_items.all())
+        if not items:
+            raise CheckoutError('Корзина пуста')
+
+        offers = get_locked_offers([item.info_product_id for item in items])
+        errors = {}
+        for item in items:
+            offer = offers.get(item.info_product_id)
+            if offer is None or not offer.shop.status or offer.version != offer.shop.catalog_version:
+                errors[item.info_product_id] = 'Товар недоступен'
+            elif offer.quantity < item.quantity:
+                errors[item.info_product_id] = f'Доступно {offer.quantity}'
+            else:
+                item.price = offer.price
+                item.total_cost = offer.price * item.quantity
+        if errors:
+            raise CheckoutError('Недостаточно товара', errors)
+
+        reserve_stock(items)
+        create_reservations(order.id, items)
+        order.ordered_items.bulk_update(items, ['price', 'total_cost'])
+        update_order_totals([order.id])
+        Order.objects.filter(id=order.id).update(status='New', contact_id=contact_id, checkout_key=key or None,
+                                                    updated_at=timezone.now())
+        order.refresh_from_db()
+        notify_orders([order.id])
+        notify_status_changes([order.id])
+        transaction.on_commit(lambda: refresh_stock(offers.keys()))
+    return order, True
@@ -0,0 +1,121 @@
+"""
+События изменения статуса заказов для push-канала.
+
+После коммита изменения заказа событие публикуется в канал каждого
+получателя: покупателя и пользователей магазинов, чьи позиции есть в
+заказе. В работе каналы - Redis pub/sub (ORDER_EVENTS_URL), поэтому
+событие из любого процесса или воркера доходит до всех ASGI-серверов.
+В тестах и без Redis используется брокер в памяти процесса.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Order, OrderItem
+
+_broker = None
+
+
+def user_channel(user_id):
+    return f'order-events:{user_id}'
+
+
+class LocalEventBroker:
+    """каналы в памяти процесса: очередь asyncio на каждого подписчика"""
+
+    def __init__(self):
+        self.queues = defaultdict(set)
+
+    def publish(self, channel, message):
+        for loop, queue in list(self.queues[channel]):
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        self.queues[channel].add(subscriber)
+        try:
+            yield lambda timeout: self.get(subscriber[1], timeout)
+        finally:
+            self.queues[channel].discard(subscriber)
+
+    @staticmethod
+    async def get(queue, timeout):
+        try:
+            return await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RedisEventBroker:
+    def __init__(self, url):
+        import redis
+        import redis.asyncio
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.async_client = redis.asyncio.Redis.from_url
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        client = self.async_client(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            yield lambda timeout: self.get(pubsub, timeout)
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+            await client.close()
+
+    @staticmethod
+    async def get(pubsub, timeout):
+        """
+        ждём сообщение до конца таймаута: get_message возвращает None и раньше,
+        когда читает служебный ответ - например, подтверждение подписки
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message and message['type'] == 'message':
+                return json.loads(message['data'])
+
+
+def get_event_broker():
+    global _broker
+    if _broker is None:
+        url = getattr(settings, 'ORDER_EVENTS_URL', None)
+        _broker = RedisEventBroker(url) if url else LocalEventBroker()
+    return _broker
+
+
+def publish_order_events(order_ids):
+    """публикуем текущий статус заказов их покупателям и магазинам"""
+    recipients = defaultdict(set)
+    for order_id, user_id in OrderItem.objects.filter(order_id__in=order_ids).values_list(
+            'order_id', 'info_product__shop__user_id').distinct():
+        if user_id:
+            recipients[order_id].add(user_id)
+    broker = get_event_broker()
+    for order in Order.objects.filter(id__in=order_ids).exclude(status='basket').only(
+            'id', 'user_id', 'status', 'updated_at'):
+        message = {'order': order.id, 'status': order.status, 'updated_at': order.updated_at.isoformat()}
+        for user_id in recipients[order.id] | {order.user_id}:
+            broker.publish(user_channel(user_id), message)
+
+
+def notify_orders(order_ids):
+    """публикация после коммита текущей транзакции"""
+    order_ids = list(order_ids)
+    if order_ids:
+        transaction.on_commit(lambda: publish_order_events(order_ids))
@@ -0,0 +1,136 @@
+"""
+Потоковая выгрузка опубликованного каталога: NDJSON, CSV или yaml в формате прайс-листа.
+
+Предложения читаются курсором .values().iterator(chunk_size) (серверный курсор в
+PostgreSQL), параметры - одним запросом на пачку, каждая пачка сразу кодируется и
+отдаётся клиенту, поэтому память не зависит от размера каталога. Время изменения
+каталога - последняя загрузка прайса или смена статуса магазина (Shop.catalog_updated_at).
+"""
+import csv
+from collections import defaultdict
+from functools import partial
+
+import ujson
+import yaml
+from django.conf import settings
+from django.db.models import F, Max
+
+from .models import InfoProduct, ProductParameter, Shop
+
+DEFAULT_EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = ('id', 'external_id', 'shop_id', 'model', 'quantity', 'price', 'suggested_retail_price',
+                 'product__name', 'product__category_id', 'product__category__name')
+CSV_COLUMNS = ('id', 'external_id', 'shop', 'category_id', 'category', 'name', 'model', 'price', 'price_rrc',
+               'quantity', 'parameters')
+
+dumps = partial(ujson.dumps, ensure_ascii=False, escape_forward_slashes=False)
+
+
+def get_export_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_EXPORT_CHUNK_SIZE)
+
+
+def get_export_offers(shop_id=None):
+    """опубликованные предложения активных магазинов"""
+    offers = InfoProduct.objects.filter(shop__status=True, version=F('shop__catalog_version'))
+    if shop_id:
+        offers = offers.filter(shop_id=shop_id)
+    return offers.order_by('id')
+
+
+def get_last_modified(shop_id=None):
+    # отключённые магазины тоже учитываем: их предложения пропали из выгрузки
+    shops = Shop.objects.filter(id=shop_id) if shop_id else Shop.objects.all()
+    return shops.aggregate(last_modified=Max('catalog_updated_at'))['last_modified']
+
+
+def iter_chunks(offers, chunk_size=None):
+    """пачки строк предложений с параметрами {название: значение}"""
+    chunk_size = chunk_size or get_export_chunk_size()
+    chunk = []
+    for row in offers.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield add_parameters(chunk)
+            chunk = []
+    if chunk:
+        yield add_parameters(chunk)
+
+
+def add_parameters(chunk):
+    parameters = defaultdict(dict)
+    for info_product_id, name, value in ProductParameter.objects.filter(
+            info_product_id__in=[row['id'] for row in chunk]).order_by('id').values_list(
+            'info_product_id', 'parameter__name', 'value'):
+        parameters[info_product_id][name] = value
+    for row in chunk:
+        row['parameters'] = parameters[row['id']]
+    return chunk
+
+
+def get_offer(row):
+    return {
+        'id': row['id'],
+        'external_id': row['external_id'],
+        'shop': row['shop_id'],
+        'category_id': row['product__category_id'],
+        'category': row['product__category__name'],
+        'name': row['product__name'],
+        'model': row['model'],
+        'price': row['price'],
+        'price_rrc': row['suggested_retail_price'],
+        'quantity': row['quantity'],
+        'parameters': row['parameters'],
+    }
+
+
+def export_ndjson(offers):
+    for chunk in iter_chunks(offers):
+        yield ''.join(dumps(get_offer(row)) + '\n' for row in chunk)
+
+
+class Echo:
+    """csv.writer пишет строку и сразу отдаёт её обратно"""
+    def write(self, value):
+        return value
+
+
+def export_csv(offers):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for chunk in iter_chunks(offers):
+        lines = []
+        for row in chunk:
+            offer = get_offer(row)
+            offer['parameters'] = dumps(offer['parameters'])
+            lines.append(writer.writerow([offer[column] for column in CSV_COLUMNS]))
+        yield ''.join(lines)
+
+
+def export_yaml(offers, shop_name):
+    """прайс-лист одного магазина в формате, который принимает загрузка"""
+    dump = partial(yaml.safe_dump, allow_unicode=True, sort_keys=False, default_flow_style=False)
+    categories = offers.order_by('product__category_id').values_list(
+        'product__category_id', 'product__category__name').distinct()
+    yield dump({'shop': shop_name})
+    yield dump({'categories': [{'id': category_id, 'name': name} for category_id, name in categories]})
+    yield 'goods:\n'
+    for chunk in iter_chunks(offers):
+        yield dump([{
+            'id': row['external_id'] if row['external_id'] is not None else row['id'],
+            'category': row['product__category_id'],
+            'model': row['model'],
+            'name': row['product__name'],
+            'price': row['price'],
+            'price_rrc': row['suggested_retail_price'],
+            'quantity': row['quantity'],
+            'parameters': row['parameters'],
+        } for row in chunk])
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'yaml': 'application/yaml; charset=utf-8',
+}
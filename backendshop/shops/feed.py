@@ -0,0 +1,58 @@
+"""
+Лента изменений заказов для магазинов.
+
+Магазин передаёт since - курсор из предыдущего ответа - и получает только
+заказы со своими позициями, изменённые после него, в порядке (updated_at, id)
+по индексу order_updated_idx. Пустой since - лента с начала. Итоги и статус
+заказа меняются вместе с updated_at, поэтому стоимость опроса зависит только
+от числа изменений.
+
+updated_at ставится в момент записи, а видна запись становится после коммита,
+поэтому изменение, записанное раньше уже выданного курсора, могло бы пропасть.
+Лента отдаёт только изменения старше PARTNER_FEED_LAG секунд - это больше
+самой долгой транзакции, меняющей заказы (оформление, пачка резервов).
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+FEED_PAGE_SIZE = 100
+DEFAULT_PARTNER_FEED_LAG = 10
+
+
+def encode_cursor(order):
+    return urlsafe_b64encode(f'{order.updated_at.isoformat()}|{order.id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(updated_at, id) из курсора, ValueError при неверном значении"""
+    try:
+        updated_at, order_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(updated_at), int(order_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as error:
+        raise ValueError('Неверный курсор') from error
+
+
+def get_feed_lag():
+    return timedelta(seconds=getattr(settings, 'PARTNER_FEED_LAG', DEFAULT_PARTNER_FEED_LAG))
+
+
+def get_partner_feed(user_id, since=None, limit=FEED_PAGE_SIZE, now=None):
+    """заказы магазина пользователя, изменённые после курсора, и курсор следующего опроса"""
+    shop_items = OrderItem.objects.filter(info_product__shop__user_id=user_id)
+    orders = Order.objects.filter(Exists(shop_items.filter(order_id=OuterRef('id'))),
+                                  updated_at__lt=(now or timezone.now()) - get_feed_lag()).exclude(status='basket')
+    if since:
+        updated_at, order_id = decode_cursor(since)
+        orders = orders.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=order_id))
+    orders = list(orders.order_by('updated_at', 'id').prefetch_related(
+        Prefetch('ordered_items', queryset=shop_items.only(
+            'id', 'order_id', 'info_product_id', 'quantity', 'price', 'total_cost')))[:limit + 1])
+    more = len(orders) > limit
+    orders = orders[:limit]
+    return orders, encode_cursor(orders[-1]) if orders else since, more
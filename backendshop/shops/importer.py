@@ -0,0 +1,436 @@
+"""
+Потоковая загрузка прайс-листов поставщиков.
+
+Файл разбирается по событиям (yaml - через события PyYAML, json - через ijson),
+товары из раздела goods отдаются по одному и записываются в базу пачками,
+поэтому расход памяти не зависит от размера прайса.
+"""
+import os
+from contextlib import nullcontext
+from uuid import uuid4
+
+import ijson
+import yaml
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump_catalog_versions
+from .models import Category, InfoProduct, OrderItem, Parameter, Product, ProductParameter, Shop, \
+    update_order_totals
+from .offers import refresh_best_offers
+from .search import get_search_backend
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_SHARD_SIZE = 10000
+IMPORT_MODES = ('sync', 'replace')
+
+
+def get_format(file):
+    """определяем формат прайса по имени файла"""
+    name = str(getattr(file, 'name', file) or '')
+    return 'json' if name.lower().endswith('.json') else 'yaml'
+
+
+def save_upload(file):
+    """сохраняем загруженный прайс на диск, чтобы передать его в задачу Celery"""
+    folder = os.path.join(settings.STORAGE, 'imports')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'{uuid4().hex}.{get_format(file)}')
+    with open(path, 'wb') as f:
+        for chunk in file.chunks():
+            f.write(chunk)
+    return path
+
+
+def progress_key(job_id):
+    return f'import-job:{job_id}'
+
+
+def iter_yaml(stream):
+    """
+    разбираем yaml по событиям: разделы верхнего уровня отдаём целиком,
+    товары из goods - по одному
+    """
+    loader = yaml.SafeLoader(stream)
+    try:
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError('Неверный формат прайс-листа')
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(loader.compose_node(None, None))
+            if key == 'goods' and loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield key, loader.construct_document(loader.compose_node(None, None))
+                loader.get_event()
+            else:
+                yield key, loader.construct_document(loader.compose_node(None, None))
+    finally:
+        loader.dispose()
+
+
+def iter_json(stream):
+    """то же самое для json-варианта прайса через ijson"""
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if not prefix or (prefix == 'goods' and event in ('start_array', 'end_array')):
+            continue
+        key = 'goods.item' if prefix.startswith('goods.item') else prefix.split('.', 1)[0]
+        if builder is None:
+            builder = ijson.ObjectBuilder()
+        builder.event(event, value)
+        if prefix == key and event not in ('start_map', 'start_array', 'map_key'):
+            yield key.split('.', 1)[0], builder.value
+            builder = None
+
+
+def iter_price_list(stream, file_format='yaml'):
+    if file_format == 'json':
+        return iter_json(stream)
+    return iter_yaml(stream)
+
+
+class ParameterCache:
+    """
+    Словарь название параметра -> id, загружается одним запросом
+    и общий для всех пачек загрузки
+    """
+
+    def __init__(self):
+        self.ids = dict(Parameter.objects.order_by().values_list('name', 'id'))
+
+    def resolve(self, names):
+        missing = set(names) - self.ids.keys()
+        if missing:
+            Parameter.objects.bulk_create([Parameter(name=name) for name in missing], ignore_conflicts=True)
+            self.ids.update(Parameter.objects.filter(name__in=missing).order_by().values_list('name', 'id'))
+        return self.ids
+
+
+class PriceListImporter:
+    """
+    Загрузка прайса поставщика в каталог пачками по batch_size товаров.
+
+    mode='sync' - товары сопоставляются с каталогом магазина по внешнему id,
+    в базу пишутся только добавленные, изменённые и удалённые позиции
+    одной транзакцией;
+    mode='replace' - ассортимент загружается заново в новую версию каталога
+    короткими транзакциями и публикуется переключением Shop.catalog_version,
+    старые версии удаляет purge_catalog_versions. Параллельная загрузка
+    работает так же: шарды пишут каждый свою часть версии, публикует её
+    publish_version после завершения всех шардов.
+    """
+    SYNC_FIELDS = ('product_id', 'model', 'quantity', 'price', 'suggested_retail_price')
+
+    def __init__(self, user_id, batch_size=None, mode='sync', progress=None):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f'Неизвестный режим загрузки {mode}')
+        self.user_id = user_id
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.mode = mode
+        self.progress = progress
+        self.shop = None
+        self.version = None
+        self.categories = {}
+        self.batch = []
+        self.seen = set()
+        self.parameters = None
+        self.search = get_search_backend()
+        self.touched = []
+        self.products = set()
+        self.stats = {'goods': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+
+    def run(self, rows):
+        with transaction.atomic() if self.mode == 'sync' else nullcontext():
+            self.parameters = ParameterCache()
+            try:
+                for key, value in rows:
+                    if key == 'shop':
+                        self.load_shop(value)
+                    elif key == 'categories':
+                        self.load_categories(value or [])
+                    elif key == 'goods' and value:
+                        self.add_item(value)
+                self.flush()
+            except Exception:
+                if self.mode == 'replace' and self.shop:
+                    # неопубликованная версия никому не видна, просто убираем её
+                    discard_catalog_version(self.shop.id, self.version, self.batch_size)
+                raise
+            if self.shop:
+                if self.mode == 'sync':
+                    self.remove_missing()
+                else:
+                    self.publish()
+                self.finish()
+        return {'shop': self.shop.id if self.shop else None, **self.stats}
+
+    def finish(self):
+        """
+        пересчитываем лучшие предложения, отмечаем время обновления каталога и сбрасываем
+        кэш страниц этого магазина и магазинов, у чьих продуктов сменилось лучшее предложение
+        """
+        shop_ids = refresh_best_offers(self.products, self.batch_size) | {self.shop.id}
+        Shop.objects.filter(id=self.shop.id).update(catalog_updated_at=timezone.now())
+        transaction.on_commit(lambda: bump_catalog_versions(shop_ids))
+
+    def load_shop(self, name):
+        if self.shop is not None:
+            return
+        self.shop, _ = Shop.objects.get_or_create(user_id=self.user_id, defaults={'name': name})
+        if self.mode == 'replace':
+            self.version = self.new_version()
+        else:
+            self.version = self.shop.catalog_version
+
+    def new_version(self):
+        """следующий номер версии каталога магазина, до публикации её никто не видит"""
+        Shop.objects.filter(id=self.shop.id).update(last_version=F('last_version') + 1)
+        return Shop.objects.values_list('last_version', flat=True).get(id=self.shop.id)
+
+    def publish(self):
+        """одним UPDATE переключаем магазин на загруженную версию каталога"""
+        old = InfoProduct.objects.filter(shop_id=self.shop.id, version=self.shop.catalog_version).order_by()
+        self.stats['removed'] = old.count()
+        self.products.update(old.values_list('product_id', flat=True).iterator(chunk_size=self.batch_size))
+        Shop.objects.filter(id=self.shop.id, catalog_version__lt=self.version).update(catalog_version=self.version)
+
+    def load_categories(self, categories):
+        for item in categories:
+            if 'id' in item:
+                category, _ = Category.objects.update_or_create(id=item['id'], defaults={'name': item['name']})
+            else:
+                category, _ = Category.objects.get_or_create(name=item['name'])
+            if self.shop:
+                category.shops.add(self.shop)
+            self.categories[category.id] = category.id
+            self.categories[category.name] = category.id
+
+    def normalize(self, item):
+        """приводим товар yaml и json прайса к одному виду"""
+        if self.shop is None:
+            # раздел shop может идти после goods - тогда берём уже созданный магазин
+            shop = Shop.objects.filter(user_id=self.user_id).first()
+            if shop is None:
+                raise ValueError('В прайс-листе не указан магазин перед списком товаров')
+            self.load_shop(shop.name)
+        parameters = item.get('parameters') or {}
+        if isinstance(parameters, list):
+            parameters = {parameter['name']: parameter['value'] for parameter in parameters}
+        if item['category'] not in self.categories:
+            raise ValueError(f'Неизвестная категория товара {item["category"]}')
+        return {
+            'external_id': item['id'],
+            'category_id': self.categories[item['category']],
+            'name': item['name'],
+            'model': item.get('model', ''),
+            'quantity': item['quantity'],
+            'price': item['price'],
+            'price_rrc': item['price_rrc'],
+            'parameters': parameters,
+        }
+
+    def add_item(self, item):
+        self.batch.append(self.normalize(item))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def get_products(self, batch):
+        """id продуктов по (название, категория), недостающие создаём одним запросом"""
+        keys = {(item['name'], item['category_id']) for item in batch}
+
+        def read():
+            return {(name, category_id): product_id for product_id, name, category_id in
+                    Product.objects.filter(name__in={key[0] for key in keys},
+                                           category_id__in={key[1] for key in keys})
+                    .order_by().values_list('id', 'name', 'category_id')}
+
+        products = read()
+        missing = keys - products.keys()
+        if missing:
+            Product.objects.bulk_create([Product(name=name, category_id=category_id)
+                                         for name, category_id in missing], ignore_conflicts=True)
+            products = read()
+        return products
+
+    def flush(self):
+        if not self.batch:
+            return
+        products = self.get_products(self.batch)
+        parameters = self.parameters.resolve({name for item in self.batch for name in item['parameters']})
+
+        rows = {}
+        values = {}
+        for item in self.batch:
+            rows[item['external_id']] = InfoProduct(product_id=products[(item['name'], item['category_id'])],
+                                                    shop_id=self.shop.id,
+                                                    version=self.version,
+                                                    external_id=item['external_id'],
+                                                    model=item['model'],
+                                                    quantity=item['quantity'],
+                                                    price=item['price'],
+                                                    suggested_retail_price=item['price_rrc'])
+            values[item['external_id']] = {parameters[name]: str(value)
+                                           for name, value in item['parameters'].items()}
+        self.batch = []
+        with transaction.atomic():
+            self.apply(rows, values)
+
+    def apply(self, rows, values):
+        self.touched = []
+        if self.mode == 'sync':
+            self.sync(rows, values)
+        else:
+            self.insert(rows, values)
+        self.search.index(self.touched)
+
+        self.seen.update(rows)
+        self.stats['goods'] += len(rows)
+        if self.progress:
+            self.progress(self.stats['goods'])
+
+    def insert(self, rows, values):
+        if not rows:
+            return
+        InfoProduct.objects.bulk_create(rows.values())
+        info_products = dict(InfoProduct.objects.filter(shop_id=self.shop.id, version=self.version,
+                                                        external_id__in=rows.keys())
+                             .values_list('external_id', 'id'))
+        self.save_parameters({info_products[external_id]: values[external_id] for external_id in rows})
+        self.touched.extend(info_products.values())
+        self.products.update(row.product_id for row in rows.values())
+        self.stats['inserted'] += len(rows)
+
+    def save_parameters(self, values):
+        ProductParameter.objects.bulk_create([
+            ProductParameter(info_product_id=info_product_id, parameter_id=parameter_id, value=value)
+            for info_product_id, parameters in values.items() for parameter_id, value in parameters.items()])
+
+    def sync(self, rows, values):
+        """сравниваем пачку с каталогом магазина и пишем только разницу"""
+        existing = {info.external_id: info for info in InfoProduct.objects.filter(
+            shop_id=self.shop.id, version=self.version, external_id__in=rows.keys()).only(
+            'external_id', *self.SYNC_FIELDS)}
+        existing_values = {info.id: {} for info in existing.values()}
+        for info_product_id, parameter_id, value in ProductParameter.objects.filter(
+                info_product_id__in=existing_values.keys()).values_list('info_product_id', 'parameter_id', 'value'):
+            existing_values[info_product_id][parameter_id] = value
+
+        changed = []
+        changed_values = {}
+        for external_id, info in existing.items():
+            row = rows[external_id]
+            is_changed = False
+            if any(getattr(info, field) != getattr(row, field) for field in self.SYNC_FIELDS):
+                self.products.update((info.product_id, row.product_id))
+                for field in self.SYNC_FIELDS:
+                    setattr(info, field, getattr(row, field))
+                changed.append(info)
+                is_changed = True
+            if existing_values[info.id] != values[external_id]:
+                changed_values[info.id] = values[external_id]
+                is_changed = True
+            self.stats['updated' if is_changed else 'unchanged'] += 1
+
+        self.touched.extend({info.id for info in changed} | changed_values.keys())
+        if changed:
+            InfoProduct.objects.bulk_update(changed, self.SYNC_FIELDS)
+        if changed_values:
+            ProductParameter.objects.filter(info_product_id__in=changed_values.keys()).delete()
+            self.save_parameters(changed_values)
+
+        self.insert({external_id: row for external_id, row in rows.items() if external_id not in existing}, values)
+
+    def remove_missing(self):
+        """
+        удаляем позиции, которых нет в новом прайсе, и их строки в корзинах;
+        позиции из оформленных заказов не удаляем, а переносим в отдельную
+        неопубликованную версию каталога, чтобы не терять историю заказов
+        """
+        missing = []
+        for info_product_id, external_id, product_id in InfoProduct.objects.filter(
+                shop_id=self.shop.id, version=self.version).order_by().values_list(
+                'id', 'external_id', 'product_id').iterator(chunk_size=self.batch_size):
+            if external_id not in self.seen:
+                missing.append(info_product_id)
+                self.products.add(product_id)
+        hidden_version = None
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            basket_items = OrderItem.objects.filter(info_product_id__in=chunk, order__status='basket')
+            baskets = set(basket_items.values_list('order_id', flat=True))
+            if baskets:
+                basket_items.delete()
+                update_order_totals(baskets)
+            ordered = InfoProduct.objects.filter(id__in=chunk, ordered_items__isnull=False)
+            if ordered.exists():
+                hidden_version = hidden_version or self.new_version()
+                ordered.update(version=hidden_version)
+            InfoProduct.objects.filter(id__in=chunk, version=self.version).delete()
+            self.search.remove(chunk)
+        self.stats['removed'] = len(missing)
+
+    def import_shard(self, shop_id, version, categories, items):
+        """
+        часть параллельной загрузки: разбираем товары шарда и пишем их в
+        неопубликованную версию каталога короткими транзакциями по batch_size
+        """
+        self.shop = Shop.objects.get(id=shop_id)
+        self.version = version
+        self.categories = dict(categories)
+        self.parameters = ParameterCache()
+        for item in items:
+            self.add_item(item)
+        self.flush()
+        return self.stats['goods']
+
+    def publish_version(self, shop_id, version):
+        """завершение параллельной загрузки: публикуем версию, собранную шардами, одним UPDATE"""
+        self.shop = Shop.objects.get(id=shop_id)
+        self.version = version
+        offers = InfoProduct.objects.filter(shop_id=shop_id, version=version).order_by()
+        self.stats['goods'] = self.stats['inserted'] = offers.count()
+        self.products.update(offers.values_list('product_id', flat=True).iterator(chunk_size=self.batch_size))
+        with transaction.atomic():
+            self.publish()
+            self.finish()
+        return {'shop': shop_id, **self.stats}
+
+
+def discard_catalog_version(shop_id, version, batch_size=None):
+    """удаляем пачками неопубликованную версию каталога после неудачной загрузки"""
+    batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    offers = InfoProduct.objects.filter(shop_id=shop_id, version=version).order_by().values_list('id', flat=True)
+    search = get_search_backend()
+    while True:
+        ids = list(offers[:batch_size])
+        if not ids:
+            return
+        InfoProduct.objects.filter(id__in=ids).delete()
+        search.remove(ids)
+
+
+def purge_catalog_versions(shop_id, batch_size=None):
+    """
+    удаляем пачками неактуальные версии каталога магазина;
+    позиции, на которые ссылаются заказы, остаются скрытыми
+    """
+    batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    catalog_version = Shop.objects.values_list('catalog_version', flat=True).get(id=shop_id)
+    old = InfoProduct.objects.filter(shop_id=shop_id, version__lt=catalog_version,
+                                     ordered_items__isnull=True).order_by().values_list('id', flat=True)
+    search = get_search_backend()
+    deleted = 0
+    while True:
+        ids = list(old[:batch_size])
+        if not ids:
+            return deleted
+        InfoProduct.objects.filter(id__in=ids).delete()
+        search.remove(ids)
+        deleted += len(ids)
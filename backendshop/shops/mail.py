@@ -0,0 +1,131 @@
+"""
+Очередь исходящих писем.
+
+Письмо записывается в таблицу OutgoingEmail в транзакции запроса, после
+коммита задача drain_email_outbox разбирает очередь пачками по
+EMAIL_BATCH_SIZE через одно SMTP-соединение на весь проход. Неудачные
+письма откладываются с экспоненциальной задержкой, после
+EMAIL_MAX_ATTEMPTS попыток помечаются ошибкой. Не больше EMAIL_RATE_LIMIT
+писем в минуту на почтовый сервер - общий счётчик в кэше для всех воркеров.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+DEFAULT_EMAIL_BATCH_SIZE = 100
+DEFAULT_EMAIL_RATE_LIMIT = 600
+DEFAULT_EMAIL_MAX_ATTEMPTS = 5
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 60 * 60
+# письмо, взятое воркером, не выдаётся другим, пока не истечёт аренда
+LEASE = timedelta(minutes=5)
+KICK_INTERVAL = 5
+
+
+def get_option(name, default):
+    return getattr(settings, name, default)
+
+
+def queue_email(subject, body, to, delay=0):
+    """ставим письмо в очередь, отправка начнётся после коммита"""
+    email = OutgoingEmail.objects.create(subject=subject, body=body, to=to,
+                                         next_attempt_at=timezone.now() + timedelta(seconds=delay))
+    if not delay:
+        transaction.on_commit(schedule_drain)
+    return email
+
+
+def schedule_drain():
+    """запускаем разбор очереди не чаще раза в KICK_INTERVAL, остальное подберёт периодическая задача"""
+    from .tasks import drain_email_outbox
+    if cache.add('email-outbox-kick', 1, KICK_INTERVAL):
+        drain_email_outbox.delay()
+
+
+def take_quota(count):
+    """резервируем до count писем в лимите текущей минуты: (ключ счётчика, сколько выдано)"""
+    limit = get_option('EMAIL_RATE_LIMIT', DEFAULT_EMAIL_RATE_LIMIT)
+    key = f'email-rate:{settings.EMAIL_HOST}:{int(time.time() // 60)}'
+    cache.add(key, 0, 2 * 60)
+    used = cache.incr(key, count)
+    granted = max(0, min(count, limit - (used - count)))
+    return_quota(key, count - granted)
+    return key, granted
+
+
+def return_quota(key, count):
+    if count > 0:
+        cache.decr(key, count)
+
+
+def claim_batch(size):
+    """берём в работу пачку писем, срок которых подошёл"""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+            status='pending', next_attempt_at__lte=now).order_by('next_attempt_at').values_list('id', flat=True)[:size])
+        OutgoingEmail.objects.filter(id__in=ids).update(next_attempt_at=now + LEASE)
+    return list(OutgoingEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def get_retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+def send_batch(connection, emails):
+    """отправляем пачку через одно соединение, результат по каждому письму сохраняем двумя UPDATE"""
+    max_attempts = get_option('EMAIL_MAX_ATTEMPTS', DEFAULT_EMAIL_MAX_ATTEMPTS)
+    sent, failed = [], []
+    for email in emails:
+        message = EmailMultiAlternatives(subject=email.subject, body=email.body,
+                                         from_email=settings.EMAIL_HOST_USER, to=[email.to])
+        try:
+            # без открытого соединения send_messages открывает и закрывает его на каждое письмо;
+            # для уже открытого open() ничего не делает
+            connection.open()
+            connection.send_messages([message])
+        except Exception as error:
+            # соединение могло оборваться, следующее письмо откроет его заново
+            connection.close()
+            email.attempts += 1
+            email.error = str(error)
+            email.status = 'failed' if email.attempts >= max_attempts else 'pending'
+            email.next_attempt_at = timezone.now() + get_retry_delay(email.attempts)
+            failed.append(email)
+        else:
+            sent.append(email.id)
+    OutgoingEmail.objects.filter(id__in=sent).update(status='sent', sent_at=timezone.now(), error='')
+    OutgoingEmail.objects.bulk_update(failed, ['attempts', 'error', 'status', 'next_attempt_at'])
+    return len(sent), len(failed)
+
+
+def drain_outbox(batch_size=None):
+    """отправляем все письма, срок которых подошёл, пока позволяет лимит"""
+    batch_size = batch_size or get_option('EMAIL_BATCH_SIZE', DEFAULT_EMAIL_BATCH_SIZE)
+    result = {'sent': 0, 'failed': 0, 'limited': False}
+    connection = get_connection()
+    try:
+        while True:
+            key, quota = take_quota(batch_size)
+            if not quota:
+                result['limited'] = True
+                break
+            emails = claim_batch(quota)
+            return_quota(key, quota - len(emails))
+            if not emails:
+                break
+            sent, failed = send_batch(connection, emails)
+            result['sent'] += sent
+            result['failed'] += failed
+            if len(emails) < quota:
+                break
+    finally:
+        connection.close()
+    return result
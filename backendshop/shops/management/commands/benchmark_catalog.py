@@ -0,0 +1,58 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from rest_framework.renderers import JSONRenderer
+
+from shops.cache import get_catalog_version
+from shops.catalog import PAGE_FIELDS, build_fragments, fragment_key, render_page
+from shops.models import InfoProduct
+from shops.serializers import ProductInfoSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнить время сборки страницы каталога сериализаторами DRF и быстрой сборкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=40)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, render, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return (time.perf_counter() - start) / repeat * 1000
+
+    def handle(self, *args, **options):
+        offers = InfoProduct.objects.filter(shop__status=True, version=F('shop__catalog_version')).order_by('id')
+        ids = list(offers.values_list('id', flat=True)[:options['page_size']])
+        if not ids:
+            self.stdout.write('Каталог пуст, загрузите прайс')
+            return
+        page = offers.filter(id__in=ids)
+        # кэш общий для всех воркеров: сбрасываем только фрагменты этой страницы
+        keys = [fragment_key(offer_id, version, get_catalog_version(shop_id))
+                for offer_id, version, shop_id in page.values_list('id', 'version', 'shop_id')]
+
+        def serializer():
+            queryset = page.select_related('shop', 'product__category', 'product__best_offer').prefetch_related(
+                'product_parameters__parameter')
+            return JSONRenderer().render(ProductInfoSerializer(queryset, many=True).data)
+
+        def fast():
+            return render_page({}, page.values(*PAGE_FIELDS))
+
+        def fast_cold():
+            cache.delete_many(keys)
+            return fast()
+
+        results = {
+            'DRF': self.measure(serializer, options['repeat']),
+            'values + ujson': self.measure(lambda: build_fragments(ids), options['repeat']),
+            'без кэша фрагментов': self.measure(fast_cold, options['repeat']),
+            'с кэшем фрагментов': self.measure(fast, options['repeat']),
+        }
+        self.stdout.write(f'Предложений на странице: {len(ids)}')
+        for name, elapsed in results.items():
+            self.stdout.write(f'{name}: {elapsed:.2f} мс, x{results["DRF"] / elapsed:.1f}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from shops.models import Order, get_order_totals, update_order_totals
+
+
+class Command(BaseCommand):
+    help = 'Сверить хранимые итоги заказов с позициями и исправить расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Пересчитать заказы с расхождениями')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        totals = get_order_totals()
+        drift = Order.objects.alias(**{f'actual_{name}': value for name, value in totals.items()}).filter(
+            ~Q(total_sum=F('actual_total_sum')) | ~Q(total_quantity=F('actual_total_quantity'))
+            | ~Q(items_count=F('actual_items_count'))).order_by('id')
+        order_ids = list(drift.values_list('id', flat=True).iterator())
+        self.stdout.write(f'Заказов с расхождениями: {len(order_ids)}')
+        if options['fix']:
+            for start in range(0, len(order_ids), options['batch_size']):
+                update_order_totals(order_ids[start:start + options['batch_size']])
+            self.stdout.write(f'Исправлено заказов: {len(order_ids)}')
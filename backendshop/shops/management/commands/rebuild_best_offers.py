@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from shops.cache import bump_catalog_versions
+from shops.models import Product
+from shops.offers import refresh_best_offers
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать лучшие предложения по всем продуктам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.order_by().values_list('id', flat=True).iterator())
+        bump_catalog_versions(refresh_best_offers(product_ids, options['batch_size']))
+        self.stdout.write(f'Пересчитано продуктов: {len(product_ids)}')
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shops.importer import DEFAULT_BATCH_SIZE
+from shops.models import InfoProduct
+from shops.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестроить полнотекстовый индекс предложений магазинов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        batch_size = options['batch_size']
+        ids = InfoProduct.objects.order_by().values_list('id', flat=True)
+        total = 0
+        with transaction.atomic():
+            backend.clear()
+            batch = []
+            for pk in ids.iterator(chunk_size=batch_size):
+                batch.append(pk)
+                if len(batch) >= batch_size:
+                    backend.index(batch)
+                    total += len(batch)
+                    batch = []
+            backend.index(batch)
+            total += len(batch)
+        self.stdout.write(f'Проиндексировано предложений: {total}')
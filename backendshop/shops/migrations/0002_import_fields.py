@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-17 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='infoproduct',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Внешний ИД'),
+        ),
+        migrations.AddField(
+            model_name='productparameter',
+            name='value',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Значение'),
+        ),
+    ]
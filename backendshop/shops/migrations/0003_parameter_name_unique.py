@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0002_import_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parameter',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название параметра'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0003_parameter_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='infoproduct',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_shop_external_id'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2 on 2026-10-17 17:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_order_items(OrderItem, source_id, target_id):
+    """позиции заказов переходят на оставшееся предложение, в одном заказе строки складываются"""
+    for item in OrderItem.objects.filter(info_product_id=source_id):
+        existing = OrderItem.objects.filter(order_id=item.order_id, info_product_id=target_id).first()
+        if existing is None:
+            item.info_product_id = target_id
+            item.save(update_fields=['info_product'])
+        else:
+            existing.quantity += item.quantity
+            existing.total_cost += item.total_cost
+            existing.save(update_fields=['quantity', 'total_cost'])
+            item.delete()
+
+
+def merge_duplicate_products(apps, schema_editor):
+    """
+    перед уникальным ограничением сливаем продукты с одинаковыми названием и
+    категорией: остаётся продукт с меньшим id, предложения остальных переходят
+    к нему; если у магазина уже есть предложение оставшегося продукта, позиции
+    заказов переносятся в него, а лишнее предложение удаляется
+    """
+    Product = apps.get_model('shops', 'Product')
+    InfoProduct = apps.get_model('shops', 'InfoProduct')
+    OrderItem = apps.get_model('shops', 'OrderItem')
+    duplicates = Product.objects.order_by().values('name', 'category_id').annotate(
+        count=Count('id'), keep=Min('id')).filter(count__gt=1)
+    for group in duplicates:
+        others = list(Product.objects.filter(name=group['name'], category_id=group['category_id']).exclude(
+            id=group['keep']).values_list('id', flat=True))
+        kept_offers = dict(InfoProduct.objects.filter(product_id=group['keep']).values_list('shop_id', 'id'))
+        for offer in InfoProduct.objects.filter(product_id__in=others).order_by('id'):
+            target_id = kept_offers.get(offer.shop_id)
+            if target_id is None:
+                offer.product_id = group['keep']
+                offer.save(update_fields=['product'])
+                kept_offers[offer.shop_id] = offer.id
+            else:
+                merge_order_items(OrderItem, offer.id, target_id)
+                offer.delete()
+        Product.objects.filter(id__in=others).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # отложенные проверки внешних ключей не дают изменить таблицу в той же транзакции
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        schema_editor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_products, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='importjob',
+            name='parallel',
+            field=models.BooleanField(default=False, verbose_name='Параллельная загрузка'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('name', 'category'), name='unique_product'),
+        ),
+    ]
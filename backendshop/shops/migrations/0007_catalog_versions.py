@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0006_parallel_import'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='infoproduct',
+            name='unique_product_info',
+        ),
+        migrations.RemoveConstraint(
+            model_name='infoproduct',
+            name='unique_shop_external_id',
+        ),
+        migrations.AddField(
+            model_name='infoproduct',
+            name='version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия каталога'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Опубликованная версия каталога'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='last_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Последняя выданная версия каталога'),
+        ),
+        migrations.AddConstraint(
+            model_name='infoproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'shop', 'version'), name='unique_product_info'),
+        ),
+        migrations.AddConstraint(
+            model_name='infoproduct',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id', 'version'), name='unique_shop_external_id'),
+        ),
+    ]
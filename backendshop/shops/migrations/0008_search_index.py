@@ -0,0 +1,33 @@
+from django.db import migrations
+
+CREATE_SQL = {
+    'sqlite': (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS shops_search_index USING fts5("
+        "name, model, parameters, tokenize='unicode61 remove_diacritics 2')",
+    ),
+    'postgresql': (
+        'CREATE TABLE IF NOT EXISTS shops_search_index (offer_id bigint PRIMARY KEY, document tsvector NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS shops_search_index_document ON shops_search_index USING GIN (document)',
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute('DROP TABLE IF EXISTS shops_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0007_catalog_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-17 17:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestOffer',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='best_offer', serialize=False, to='shops.product', verbose_name='Продукт')),
+                ('price', models.PositiveIntegerField(verbose_name='Минимальная цена')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Общий остаток')),
+                ('offers', models.PositiveIntegerField(verbose_name='Количество предложений')),
+                ('info_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shops.infoproduct', verbose_name='Предложение')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shops.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Лучшее предложение',
+                'verbose_name_plural': 'Лучшие предложения',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-17 17:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('shops', 'Order')
+    OrderItem = apps.get_model('shops', 'OrderItem')
+    items = OrderItem.objects.filter(order_id=OuterRef('id')).order_by().values('order_id')
+    Order.objects.update(
+        total_sum=Coalesce(Subquery(items.annotate(value=Sum('total_cost')).values('value')), 0),
+        total_quantity=Coalesce(Subquery(items.annotate(value=Sum('quantity')).values('value')), 0),
+        items_count=Coalesce(Subquery(items.annotate(value=Count('id')).values('value')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0009_bestoffer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма заказа'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-17 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0014_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('basket', 'Статус корзины'), ('New', 'Новый'), ('Confirmed', 'Подтвержден'), ('Assembled', 'Собран'), ('Sent', 'Отправлен'), ('Delivered', 'Доставлен'), ('Canceled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('notified_status', models.CharField(blank=True, max_length=20, verbose_name='Отправленный статус')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='shops.order', verbose_name='Заказ')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_notifications', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Уведомление о заказе',
+                'verbose_name_plural': 'Уведомления о заказах',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ordernotification',
+            constraint=models.UniqueConstraint(fields=('user', 'order'), name='unique_order_notification'),
+        ),
+    ]
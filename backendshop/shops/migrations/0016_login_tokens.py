@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-17 18:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 1000
+
+
+def copy_auth_tokens(apps, schema_editor):
+    """
+    выданные ранее бессрочные токены продолжают действовать до истечения срока от даты выдачи;
+    bulk_create ставит в auto_now_add поле created текущее время, поэтому дату выдачи
+    возвращаем вторым запросом на пачку
+    """
+    Token = apps.get_model('authtoken', 'Token')
+    LoginToken = apps.get_model('shops', 'LoginToken')
+    rows = list(Token.objects.order_by('key').values_list('key', 'user_id', 'created'))
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        tokens = LoginToken.objects.bulk_create([LoginToken(key=key, user_id=user_id) for key, user_id, _ in batch])
+        for token, (_, _, created) in zip(tokens, batch):
+            token.created = created
+        LoginToken.objects.bulk_update(tokens, ['created'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('shops', '0015_order_notification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='confirmemailtoken',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='When was this token generated'),
+        ),
+        migrations.CreateModel(
+            name='LoginToken',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Key')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Выдан')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='login_tokens', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Токен входа',
+                'verbose_name_plural': 'Токены входа',
+            },
+        ),
+        migrations.RunPython(copy_auth_tokens, migrations.RunPython.noop),
+    ]
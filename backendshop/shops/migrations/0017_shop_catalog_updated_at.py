@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-17 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0016_login_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Каталог обновлён'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-17 18:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0017_shop_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data_time', models.DateTimeField(verbose_name='Создан')),
+                ('status', models.CharField(choices=[('basket', 'Статус корзины'), ('New', 'Новый'), ('Confirmed', 'Подтвержден'), ('Assembled', 'Собран'), ('Sent', 'Отправлен'), ('Delivered', 'Доставлен'), ('Canceled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('total_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма заказа')),
+                ('total_quantity', models.PositiveIntegerField(default=0, verbose_name='Количество товаров')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='Количество позиций')),
+                ('updated_at', models.DateTimeField(verbose_name='Изменён')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')),
+                ('contact', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shops.contact', verbose_name='Контакт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архив заказов',
+                'ordering': ('-data_time',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('info_product_id', models.BigIntegerField(verbose_name='Предложение')),
+                ('shop_id', models.BigIntegerField(verbose_name='Магазин')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('total_cost', models.PositiveIntegerField(verbose_name='Общая стоимость')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ordered_items', to='shops.archivedorder', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Позиция архивного заказа',
+                'verbose_name_plural': 'Позиции архивных заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-data_time'], name='archived_order_user_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0018_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='infoproduct',
+            index=models.Index(fields=['shop', 'version', 'id'], name='info_product_shop_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-data_time'], name='order_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['order', 'total_cost', 'quantity'], name='order_item_totals_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def restore_token_dates(apps, schema_editor):
+    """
+    0016 копировала токены через bulk_create, и дата выдачи заменялась временем
+    миграции; возвращаем её из исходных токенов DRF
+    """
+    Token = apps.get_model('authtoken', 'Token')
+    LoginToken = apps.get_model('shops', 'LoginToken')
+    rows = list(Token.objects.order_by('key').values_list('key', 'created'))
+    for start in range(0, len(rows), BATCH_SIZE):
+        created = dict(rows[start:start + BATCH_SIZE])
+        tokens = list(LoginToken.objects.filter(key__in=created.keys()).only('key', 'created'))
+        for token in tokens:
+            token.created = created[token.key]
+        LoginToken.objects.bulk_update(tokens, ['created'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('shops', '0019_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_token_dates, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
+import secrets
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django_rest_passwordreset.tokens import get_token_generator
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from auth_user.models import UserManager, USER_TYPE_CHOICES
@@ -15,6 +20,19 @@ STATUS_CHOICES = (
     ('Canceled', 'Отменен'),
 )
 
+EMAIL_STATUS_CHOICES = (
+    ('pending', 'Ожидает отправки'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),
+)
+
+IMPORT_STATUS_CHOICES = (
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершена'),
+    ('failed', 'Ошибка'),
+)
+
 
 class User(AbstractUser):
     """
@@ -79,6 +97,7 @@ class ConfirmEmailToken(models.Model):
 
     created_at = models.DateTimeField(
         auto_now_add=True,
+        db_index=True,
         verbose_name=_("When was this token generated")
     )
 
@@ -98,12 +117,38 @@ class ConfirmEmailToken(models.Model):
         return "Password reset token for user {user}".format(user=self.user)
 
 
+class LoginToken(models.Model):
+    """
+    Токен входа в API, действует AUTH_TOKEN_TTL секунд с момента выдачи.
+    Каждый вход выдаёт новый токен, у пользователя их может быть несколько
+    """
+    key = models.CharField(_("Key"), max_length=64, primary_key=True)
+    user = models.ForeignKey(User, related_name='login_tokens', on_delete=models.CASCADE,
+                             verbose_name='Пользователь')
+    created = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Выдан')
+
+    class Meta:
+        verbose_name = 'Токен входа'
+        verbose_name_plural = 'Токены входа'
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = secrets.token_hex(20)
+        return super(LoginToken, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.user_id} - {self.created}'
+
+
 class Shop(models.Model):
     name = models.CharField(max_length=50, verbose_name='Название магазина')
     url = models.URLField(verbose_name='Сайт магазина', null=True, blank=True)
     user = models.OneToOneField(User, verbose_name='Пользователь', blank=True, null=True,
                                 on_delete=models.CASCADE)
     status = models.BooleanField(verbose_name='Статус получения заказа', default=True)
+    catalog_version = models.PositiveIntegerField(verbose_name='Опубликованная версия каталога', default=0)
+    last_version = models.PositiveIntegerField(verbose_name='Последняя выданная версия каталога', default=0)
+    catalog_updated_at = models.DateTimeField(verbose_name='Каталог обновлён', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -136,6 +181,9 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
         ordering = ('-name',)
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'category'], name='unique_product'),
+        ]
 
     def __str__(self):
         return f'{self.category} - {self.name}'
@@ -143,6 +191,7 @@ class Product(models.Model):
 
 class InfoProduct(models.Model):
     model = models.CharField(max_length=100, verbose_name='Модель')
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД', blank=True, null=True)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     suggested_retail_price = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
@@ -150,20 +199,47 @@ class InfoProduct(models.Model):
                                 blank=True, on_delete=models.CASCADE)
     shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='product_infos',
                              blank=True, on_delete=models.CASCADE)
+    version = models.PositiveIntegerField(verbose_name='Версия каталога', default=0)
 
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = 'Информационный список о продуктах'
         constraints = [
-            models.UniqueConstraint(fields=['product', 'shop'], name='unique_product_info'),
+            models.UniqueConstraint(fields=['product', 'shop', 'version'], name='unique_product_info'),
+            models.UniqueConstraint(fields=['shop', 'external_id', 'version'], name='unique_shop_external_id'),
+        ]
+        indexes = [
+            # опубликованная версия каталога магазина в порядке id
+            models.Index(fields=['shop', 'version', 'id'], name='info_product_shop_version_idx'),
         ]
 
     def __str__(self):
         return f'{self.shop.name} - {self.product.name}'
 
 
+class BestOffer(models.Model):
+    """
+    Лучшее предложение по продукту среди магазинов, пересчитывается при загрузке прайсов
+    """
+    product = models.OneToOneField(Product, verbose_name='Продукт', related_name='best_offer',
+                                   primary_key=True, on_delete=models.CASCADE)
+    info_product = models.ForeignKey(InfoProduct, verbose_name='Предложение', related_name='+',
+                                     on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='+', on_delete=models.CASCADE)
+    price = models.PositiveIntegerField(verbose_name='Минимальная цена')
+    quantity = models.PositiveIntegerField(verbose_name='Общий остаток')
+    offers = models.PositiveIntegerField(verbose_name='Количество предложений')
+
+    class Meta:
+        verbose_name = 'Лучшее предложение'
+        verbose_name_plural = 'Лучшие предложения'
+
+    def __str__(self):
+        return f'{self.product_id} - {self.price}'
+
+
 class Parameter(models.Model):
-    name = models.CharField(max_length=50, verbose_name='Название параметра')
+    name = models.CharField(max_length=50, verbose_name='Название параметра', unique=True)
 
     class Meta:
         verbose_name = 'Название параметра'
@@ -179,6 +255,7 @@ class ProductParameter(models.Model):
                                      related_name='product_parameters', on_delete=models.CASCADE)
     parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='product_parameters', blank=True,
                                   on_delete=models.CASCADE)
+    value = models.CharField(max_length=100, verbose_name='Значение', blank=True)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -198,11 +275,26 @@ class Order(models.Model):
                                 null=True, on_delete=models.CASCADE)
     data_time = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, verbose_name='Статус', choices=STATUS_CHOICES)
+    total_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма заказа')
+    total_quantity = models.PositiveIntegerField(default=0, verbose_name='Количество товаров')
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Количество позиций')
+    checkout_key = models.CharField(max_length=64, null=True, blank=True, verbose_name='Ключ оформления')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Список заказов'
         ordering = ('-data_time',)
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'checkout_key'], name='unique_checkout_key'),
+        ]
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='order_updated_idx'),
+            # корзина пользователя и его заказы по статусу
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            # история заказов пользователя без сортировки
+            models.Index(fields=['user', '-data_time'], name='order_user_time_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} - {self.data_time}'
@@ -223,10 +315,182 @@ class OrderItem(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['order_id', 'info_product'], name='unique_order_item'),
         ]
+        indexes = [
+            # итоги заказа считаются только по индексу, без чтения строк
+            models.Index(fields=['order', 'total_cost', 'quantity'], name='order_item_totals_idx'),
+        ]
 
     def __str__(self):
         return f'№ {self.order} - {self.info_product.model}. Кол-во: {self.quantity}. Сумма: {self.total_cost}'
 
     def save(self, *args, **kwargs):
         self.total_cost = self.price * self.quantity
-        super(OrderItem, self).save(*args, **kwargs)
+        with transaction.atomic():
+            super(OrderItem, self).save(*args, **kwargs)
+            update_order_totals([self.order_id])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super(OrderItem, self).delete(*args, **kwargs)
+            update_order_totals([self.order_id])
+        return result
+
+
+class ArchivedOrder(models.Model):
+    """
+    Доставленный или отменённый заказ, перенесённый из shops_order задачей архивации.
+    Первичный ключ совпадает с id исходного заказа.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='archived_orders',
+                             on_delete=models.CASCADE)
+    contact = models.ForeignKey(Contact, verbose_name='Контакт', related_name='+', null=True, blank=True,
+                                on_delete=models.SET_NULL)
+    data_time = models.DateTimeField(verbose_name='Создан')
+    status = models.CharField(max_length=20, verbose_name='Статус', choices=STATUS_CHOICES)
+    total_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма заказа')
+    total_quantity = models.PositiveIntegerField(default=0, verbose_name='Количество товаров')
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Количество позиций')
+    updated_at = models.DateTimeField(verbose_name='Изменён')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')
+
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архив заказов'
+        ordering = ('-data_time',)
+        indexes = [
+            models.Index(fields=['user', '-data_time'], name='archived_order_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.data_time}'
+
+
+class ArchivedOrderItem(models.Model):
+    """позиция архивного заказа: снимок без ссылок на каталог, предложение могло быть удалено"""
+    order = models.ForeignKey(ArchivedOrder, verbose_name='Заказ', related_name='ordered_items',
+                              on_delete=models.CASCADE)
+    info_product_id = models.BigIntegerField(verbose_name='Предложение')
+    shop_id = models.BigIntegerField(verbose_name='Магазин')
+    name = models.CharField(max_length=100, verbose_name='Название')
+    model = models.CharField(max_length=100, verbose_name='Модель')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    total_cost = models.PositiveIntegerField(verbose_name='Общая стоимость')
+
+    class Meta:
+        verbose_name = 'Позиция архивного заказа'
+        verbose_name_plural = 'Позиции архивных заказов'
+
+    def __str__(self):
+        return f'№ {self.order_id} - {self.model}. Кол-во: {self.quantity}. Сумма: {self.total_cost}'
+
+
+class StockReservation(models.Model):
+    """
+    Резерв остатка под оформленный, но не подтверждённый заказ.
+    По истечении срока резерв снимается, а заказ отменяется.
+    """
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='reservations', on_delete=models.CASCADE)
+    info_product = models.ForeignKey(InfoProduct, verbose_name='Предложение', related_name='reservations',
+                                     on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(verbose_name='Истекает', db_index=True)
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+
+    def __str__(self):
+        return f'{self.order_id} - {self.info_product_id}: {self.quantity}'
+
+
+class OrderNotification(models.Model):
+    """
+    Последний статус заказа для письма-сводки пользователю: промежуточные
+    статусы перезаписываются, уже отправленный статус повторно не отправляется
+    """
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='order_notifications',
+                             on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='notifications', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, verbose_name='Статус', choices=STATUS_CHOICES)
+    notified_status = models.CharField(max_length=20, verbose_name='Отправленный статус', blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Уведомление о заказе'
+        verbose_name_plural = 'Уведомления о заказах'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'order'], name='unique_order_notification'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.order_id}: {self.status}'
+
+
+class OutgoingEmail(models.Model):
+    """
+    Исходящее письмо в очереди на отправку, очередь разбирает задача Celery
+    """
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    to = models.CharField(max_length=254, verbose_name='Получатель')
+    status = models.CharField(max_length=10, verbose_name='Статус', choices=EMAIL_STATUS_CHOICES,
+                              default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток отправки')
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.to} - {self.subject}'
+
+
+def get_order_totals():
+    """подзапросы с итогами заказа по его позициям"""
+    items = OrderItem.objects.filter(order_id=OuterRef('id')).order_by().values('order_id')
+    return {
+        'total_sum': Coalesce(Subquery(items.annotate(value=Sum('total_cost')).values('value')), 0),
+        'total_quantity': Coalesce(Subquery(items.annotate(value=Sum('quantity')).values('value')), 0),
+        'items_count': Coalesce(Subquery(items.annotate(value=Count('id')).values('value')), 0),
+    }
+
+
+def update_order_totals(order_ids):
+    """
+    Пересчитываем хранимые итоги заказов одним UPDATE.
+    Вызывается при любом изменении позиций, в той же транзакции.
+    """
+    return Order.objects.filter(id__in=order_ids).update(updated_at=timezone.now(), **get_order_totals())
+
+
+class ImportJob(models.Model):
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    file = models.CharField(max_length=255, verbose_name='Файл прайса')
+    mode = models.CharField(max_length=10, verbose_name='Режим загрузки', default='sync')
+    parallel = models.BooleanField(default=False, verbose_name='Параллельная загрузка')
+    status = models.CharField(max_length=10, verbose_name='Статус', choices=IMPORT_STATUS_CHOICES,
+                              default='pending')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Обработано товаров')
+    result = models.JSONField(default=dict, blank=True, verbose_name='Результат')
+    errors = models.TextField(blank=True, verbose_name='Ошибки')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Загрузка прайса'
+        verbose_name_plural = 'Загрузки прайсов'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.user} - {self.created_at} - {self.status}'
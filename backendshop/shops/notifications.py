@@ -0,0 +1,71 @@
+"""
+Письма-сводки об изменении статусов заказов.
+
+Каждое изменение статуса записывается в OrderNotification - одна строка
+на пару (пользователь, заказ), новый статус перезаписывает промежуточный.
+Первое изменение запускает отложенную на NOTIFICATION_WINDOW секунд
+задачу, которая одним письмом сообщает все накопленные статусы, кроме
+уже отправленных.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .mail import queue_email
+from .models import STATUS_CHOICES, Order, OrderNotification, User
+
+DEFAULT_NOTIFICATION_WINDOW = 5 * 60
+FINAL_STATUSES = ('Delivered', 'Canceled')
+
+
+def get_window():
+    return getattr(settings, 'NOTIFICATION_WINDOW', DEFAULT_NOTIFICATION_WINDOW)
+
+
+def digest_key(user_id):
+    return f'order-digest:{user_id}'
+
+
+def record_status_changes(order_ids):
+    """запоминаем текущие статусы заказов для сводки их покупателям"""
+    rows = [OrderNotification(user_id=user_id, order_id=order_id, status=order_status)
+            for order_id, user_id, order_status in Order.objects.filter(id__in=order_ids).exclude(
+                status='basket').values_list('id', 'user_id', 'status')]
+    OrderNotification.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user', 'order'],
+                                          update_fields=['status', 'updated_at'])
+    for user_id in {row.user_id for row in rows}:
+        schedule_digest(user_id)
+
+
+def notify_status_changes(order_ids):
+    """запись после коммита текущей транзакции"""
+    order_ids = list(order_ids)
+    if order_ids:
+        transaction.on_commit(lambda: record_status_changes(order_ids))
+
+
+def schedule_digest(user_id):
+    from .tasks import send_order_digest
+    window = get_window()
+    if cache.add(digest_key(user_id), 1, window * 2):
+        send_order_digest.apply_async((user_id,), countdown=window)
+
+
+def send_digest(user_id):
+    """одно письмо со всеми неотправленными статусами заказов пользователя"""
+    cache.delete(digest_key(user_id))
+    statuses = dict(STATUS_CHOICES)
+    with transaction.atomic():
+        pending = list(OrderNotification.objects.select_for_update().filter(user_id=user_id).exclude(
+            status=F('notified_status')).order_by('order_id').values_list('id', 'order_id', 'status'))
+        if not pending:
+            return 0
+        lines = [f'Заказ №{order_id}: {statuses.get(order_status, order_status)}'
+                 for _, order_id, order_status in pending]
+        email = User.objects.values_list('email', flat=True).get(id=user_id)
+        queue_email('Обновление статуса заказов', '\n'.join(lines), email)
+        ids = [pk for pk, _, _ in pending]
+        OrderNotification.objects.filter(id__in=ids).update(notified_status=F('status'))
+        OrderNotification.objects.filter(id__in=ids, status__in=FINAL_STATUSES).delete()
+    return len(pending)
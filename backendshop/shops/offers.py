@@ -0,0 +1,75 @@
+"""
+Индекс лучших предложений: для каждого продукта самая низкая цена среди
+опубликованных предложений магазинов, принимающих заказы, с товаром в наличии,
+магазин с этой ценой, общий остаток и число предложений.
+
+Лучшее предложение показывается в кэшированных страницах каталога у предложений
+всех магазинов продукта, поэтому пересчёт возвращает магазины, чьи страницы
+устарели; их версии каталога увеличивает вызывающий код после коммита.
+Оформление заказа и снятие резервов меняют остатки без загрузки прайса,
+после коммита они вызывают refresh_stock.
+"""
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .cache import bump_catalog_versions
+from .models import BestOffer, InfoProduct, Shop
+
+DEFAULT_BATCH_SIZE = 1000
+BEST_OFFER_FIELDS = ('product_id', 'info_product_id', 'shop_id', 'price', 'quantity', 'offers')
+
+
+def get_active_offers():
+    return InfoProduct.objects.filter(shop__status=True, version=F('shop__catalog_version'), quantity__gt=0)
+
+
+def refresh_best_offers(product_ids, batch_size=None):
+    """пересчитываем лучшие предложения указанных продуктов пачками, возвращаем id магазинов с изменениями"""
+    batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    product_ids = list(product_ids)
+    shop_ids = set()
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start:start + batch_size]
+        offers = get_active_offers().filter(product_id__in=chunk)
+        old = {row[0]: row for row in BestOffer.objects.filter(product_id__in=chunk).values_list(*BEST_OFFER_FIELDS)}
+
+        totals = {product_id: (count, quantity) for product_id, count, quantity in
+                  offers.order_by().values('product_id').annotate(
+                      count=Count('id'), quantity=Sum('quantity')).values_list('product_id', 'count', 'quantity')}
+        best = {}
+        for product_id, info_product_id, shop_id, price in offers.order_by('product_id', 'price', 'id').values_list(
+                'product_id', 'id', 'shop_id', 'price'):
+            if product_id not in best:
+                best[product_id] = BestOffer(product_id=product_id, info_product_id=info_product_id,
+                                             shop_id=shop_id, price=price,
+                                             quantity=totals[product_id][1], offers=totals[product_id][0])
+
+        BestOffer.objects.filter(product_id__in=chunk).exclude(product_id__in=best.keys()).delete()
+        BestOffer.objects.bulk_create(best.values(), update_conflicts=True, unique_fields=['product'],
+                                      update_fields=['info_product', 'shop', 'price', 'quantity', 'offers'])
+
+        new = {offer.product_id: tuple(getattr(offer, field) for field in BEST_OFFER_FIELDS) for offer in best.values()}
+        changed = [product_id for product_id in chunk if old.get(product_id) != new.get(product_id)]
+        if changed:
+            shop_ids.update(InfoProduct.objects.filter(product_id__in=changed).order_by().values_list(
+                'shop_id', flat=True).distinct())
+    return shop_ids
+
+
+def refresh_shop_offers(shop_id, batch_size=None):
+    """пересчёт после смены статуса магазина - по всем продуктам его каталога"""
+    product_ids = set(InfoProduct.objects.filter(shop_id=shop_id).order_by().values_list(
+        'product_id', flat=True).iterator())
+    return refresh_best_offers(product_ids, batch_size)
+
+
+def refresh_stock(info_product_ids):
+    """
+    после изменения остатков предложений: пересчёт лучших предложений их продуктов,
+    время изменения каталога их магазинов и версии кэша всех затронутых страниц
+    """
+    rows = set(InfoProduct.objects.filter(id__in=info_product_ids).values_list('product_id', 'shop_id'))
+    shop_ids = {shop_id for _, shop_id in rows}
+    Shop.objects.filter(id__in=shop_ids).update(catalog_updated_at=timezone.now())
+    bump_catalog_versions(shop_ids | refresh_best_offers({product_id for product_id, _ in rows}))
@@ -0,0 +1,35 @@
+"""
+Выборки заказов для представлений.
+
+Те же функции использует проверка планов запросов в тестах, поэтому
+изменение выборки в представлении сразу проверяется на использование индексов.
+"""
+from django.db.models import Prefetch, Sum
+
+from .models import ArchivedOrder, Order, OrderItem
+
+# всё, что выводит OrderItemCreateSerializer, включая лучшее предложение продукта
+ORDERED_ITEMS_PREFETCH = ('ordered_items__info_product__product__category',
+                          'ordered_items__info_product__product__best_offer',
+                          'ordered_items__info_product__product_parameters__parameter')
+
+
+def get_basket_orders(user_id):
+    return Order.objects.filter(user_id=user_id, status='basket').prefetch_related(*ORDERED_ITEMS_PREFETCH)
+
+
+def get_user_orders(user_id):
+    return Order.objects.filter(user_id=user_id).exclude(status='basket').select_related(
+        'contact').prefetch_related(*ORDERED_ITEMS_PREFETCH)
+
+
+def get_archived_orders(user_id):
+    return ArchivedOrder.objects.filter(user_id=user_id).select_related('contact').prefetch_related('ordered_items')
+
+
+def get_partner_orders(shop_user_id):
+    """заказы с позициями магазина, позиции и итоги - только его"""
+    shop_items = Prefetch('ordered_items', queryset=OrderItem.objects.filter(info_product__shop__user_id=shop_user_id))
+    return Order.objects.filter(ordered_items__info_product__shop__user_id=shop_user_id).exclude(
+        status='basket').prefetch_related(shop_items, *ORDERED_ITEMS_PREFETCH).select_related('contact').annotate(
+        shop_sum=Sum('ordered_items__total_cost'), shop_quantity=Sum('ordered_items__quantity'))
@@ -0,0 +1,36 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    keyset-пагинация по первичному ключу: без COUNT(*) и OFFSET,
+    любая страница стоит столько же, сколько первая
+    """
+    ordering = '-id'
+
+    @classmethod
+    def requested(cls, request):
+        """keyset включается параметром cursor, для первой страницы - пустым"""
+        return cls.cursor_query_param in request.query_params
+
+
+class CatalogKeysetPagination(KeysetPagination):
+    ordering = 'id'
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    постраничная выдача каталога, с параметром cursor - keyset-пагинация
+    """
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if CatalogKeysetPagination.requested(request):
+            self.keyset = CatalogKeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,104 @@
+"""
+Резервы остатков под оформленные заказы.
+
+Оформление заказа списывает остаток и записывает резерв со сроком
+RESERVATION_TTL на каждую позицию. Магазин подтверждает заказ (confirm_order):
+снимаются резервы его позиций, товар остаётся списанным; статус Confirmed
+заказ получает, когда резервов не осталось, то есть его подтвердили все
+магазины. Если за это время заказ не подтвердили, периодическая задача
+отменяет его и возвращает на склад товар всех позиций, после коммита
+пересчитываются лучшие предложения и сбрасывается кэш каталога. Заказы с
+просроченными резервами выбираются по индексу на expires_at пачками по
+RESERVATION_BATCH_SIZE и снимаются целиком, каждая пачка - отдельная короткая
+транзакция.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .events import notify_orders
+from .models import InfoProduct, Order, OrderItem, StockReservation
+from .notifications import notify_status_changes
+from .offers import refresh_stock
+
+DEFAULT_RESERVATION_TTL = 24 * 60 * 60
+DEFAULT_RESERVATION_BATCH_SIZE = 1000
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'RESERVATION_TTL', DEFAULT_RESERVATION_TTL))
+
+
+def create_reservations(order_id, items):
+    expires_at = timezone.now() + get_reservation_ttl()
+    StockReservation.objects.bulk_create([
+        StockReservation(order_id=order_id, info_product_id=item.info_product_id, quantity=item.quantity,
+                         expires_at=expires_at) for item in items])
+
+
+def confirm_order(shop_user_id, order_id):
+    """
+    магазин подтверждает свои позиции нового заказа: их резервы удаляются и
+    больше не вернут товар на склад; когда резервов у заказа не осталось,
+    он получает статус Confirmed
+    """
+    with transaction.atomic():
+        # заказ, уже отменённый снятием резерва, подтвердить нельзя
+        shop_items = OrderItem.objects.filter(order_id=OuterRef('id'), info_product__shop__user_id=shop_user_id)
+        if not Order.objects.select_for_update().filter(id=order_id, status='New').filter(
+                Exists(shop_items)).exists():
+            return False
+        StockReservation.objects.filter(order_id=order_id, info_product__shop__user_id=shop_user_id).delete()
+        if not StockReservation.objects.filter(order_id=order_id).exists():
+            Order.objects.filter(id=order_id).update(status='Confirmed', updated_at=timezone.now())
+            notify_orders([order_id])
+            notify_status_changes([order_id])
+    return True
+
+
+def release_batch(now, batch_size):
+    """
+    Снимаем резервы одной пачки заказов с просроченными резервами, все резервы
+    заказа в одной транзакции. Неподтверждённые заказы отменяются, товар всех
+    их позиций возвращается на склад; резервы остальных заказов просто удаляются.
+    Возвращает число заказов, снятых резервов и возвращённых единиц товара.
+    """
+    with transaction.atomic():
+        expired = StockReservation.objects.filter(expires_at__lte=now).values('order_id')
+        order_ids = list(Order.objects.select_for_update(skip_locked=True).filter(id__in=expired).order_by(
+            'id').values_list('id', flat=True)[:batch_size])
+        if not order_ids:
+            return 0, 0, 0
+        expired_orders = set(Order.objects.filter(id__in=order_ids, status='New').values_list('id', flat=True))
+
+        units = defaultdict(int)
+        for info_product_id, quantity in OrderItem.objects.filter(order_id__in=expired_orders).values_list(
+                'info_product_id', 'quantity'):
+            units[info_product_id] += quantity
+        for info_product_id in sorted(units):
+            InfoProduct.objects.filter(id=info_product_id).update(quantity=F('quantity') + units[info_product_id])
+        if units:
+            transaction.on_commit(lambda: refresh_stock(units.keys()))
+
+        Order.objects.filter(id__in=expired_orders).update(status='Canceled', updated_at=timezone.now())
+        notify_orders(expired_orders)
+        notify_status_changes(expired_orders)
+        released = StockReservation.objects.filter(order_id__in=order_ids).delete()[0]
+    return len(order_ids), released, sum(units.values())
+
+
+def release_expired_reservations(batch_size=None, now=None):
+    """снимаем все просроченные резервы, batch_size - заказов в пачке; возвращаем число резервов и возвращённых единиц товара"""
+    batch_size = batch_size or getattr(settings, 'RESERVATION_BATCH_SIZE', DEFAULT_RESERVATION_BATCH_SIZE)
+    now = now or timezone.now()
+    released = reclaimed = 0
+    while True:
+        orders, count, units = release_batch(now, batch_size)
+        released += count
+        reclaimed += units
+        if orders < batch_size:
+            return {'released': released, 'reclaimed': reclaimed}
@@ -0,0 +1,134 @@
+"""
+Полнотекстовый поиск по предложениям магазинов.
+
+Индекс - отдельная таблица shops_search_index (FTS5 в SQLite, tsvector с GIN-индексом
+в PostgreSQL, создаётся миграцией), документ - название продукта, модель и параметры предложения.
+Индекс обновляет загрузка прайсов, полностью его перестраивает команда
+rebuild_search_index. Бэкенд выбирается по базе данных или настройкой SEARCH_BACKEND.
+"""
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Count, Max, Min
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import InfoProduct, ProductParameter
+
+SEARCH_TABLE = 'shops_search_index'
+FACET_LIMIT = 200
+
+
+def get_terms(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def get_documents(ids):
+    """(id предложения, название продукта, модель, параметры) для индексации"""
+    parameters = defaultdict(list)
+    for info_product_id, name, value in ProductParameter.objects.filter(
+            info_product_id__in=ids).values_list('info_product_id', 'parameter__name', 'value'):
+        parameters[info_product_id].append(f'{name} {value}')
+    for info_product_id, model, name in InfoProduct.objects.filter(id__in=ids).order_by().values_list(
+            'id', 'model', 'product__name'):
+        yield info_product_id, name, model, ' '.join(parameters[info_product_id])
+
+
+class SearchBackend:
+    def index(self, ids):
+        raise NotImplementedError
+
+    def remove(self, ids):
+        raise NotImplementedError
+
+    def match(self, text):
+        """подзапрос с id найденных предложений для filter(id__in=...)"""
+        raise NotImplementedError
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+
+class SqliteSearchBackend(SearchBackend):
+    def index(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        self.remove(ids)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, name, model, parameters) VALUES (%s, %s, %s, %s)',
+                               list(get_documents(ids)))
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk in ids])
+
+    def match(self, text):
+        query = ' '.join(f'"{term}"*' for term in get_terms(text))
+        return RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', (query,))
+
+
+class PostgresSearchBackend(SearchBackend):
+    def index(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (offer_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', %s), 'A') || to_tsvector('simple', %s || ' ' || %s)) "
+                f"ON CONFLICT (offer_id) DO UPDATE SET document = EXCLUDED.document",
+                list(get_documents(ids)))
+
+    def remove(self, ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE offer_id = ANY(%s)', (list(ids),))
+
+    def match(self, text):
+        query = ' & '.join(f'{term}:*' for term in get_terms(text))
+        return RawSQL(f"SELECT offer_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)", (query,))
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(vendor=None):
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    vendor = vendor or connection.vendor
+    if vendor not in SEARCH_BACKENDS:
+        raise ImproperlyConfigured(f'Полнотекстовый поиск не поддерживается для {vendor}')
+    return SEARCH_BACKENDS[vendor]()
+
+
+def search_offers(queryset, text=None, price_min=None, price_max=None, parameters=()):
+    """фильтруем предложения по тексту, цене и значениям параметров (название, значение)"""
+    if text and get_terms(text):
+        queryset = queryset.filter(id__in=get_search_backend().match(text))
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+    for name, value in parameters:
+        queryset = queryset.filter(product_parameters__parameter__name=name, product_parameters__value=value)
+    return queryset
+
+
+def get_facets(queryset):
+    """значения параметров с количеством предложений и диапазон цен по найденным предложениям"""
+    offers = queryset.order_by().values('id')
+    parameters = defaultdict(list)
+    for name, value, count in ProductParameter.objects.filter(info_product_id__in=offers).values_list(
+            'parameter__name', 'value').annotate(count=Count('info_product_id')).order_by(
+            'parameter__name', '-count')[:FACET_LIMIT]:
+        parameters[name].append({'value': value, 'count': count})
+    price = InfoProduct.objects.filter(id__in=offers).aggregate(min=Min('price'), max=Max('price'))
+    return {'parameters': dict(parameters), 'price': price}
@@ -1,13 +1,18 @@
+from django.core.cache import cache
+from django.utils import timezone
 from rest_framework import serializers
 
 
-from .models import Category, Shop, InfoProduct, Product, ProductParameter, OrderItem, Order, Contact, User
+from .importer import progress_key
+from .models import Category, Shop, InfoProduct, Product, ProductParameter, OrderItem, Order, Contact, User, \
+    ImportJob, BestOffer, ArchivedOrder, ArchivedOrderItem
 
 
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contact
-        fields = ('id', 'city', 'street', 'house', 'apartment', 'e_mail', 'user', 'phone', 'work_phone',)
+        fields = ('id', 'city', 'street', 'house', 'structure', 'building', 'apartment', 'user', 'phone',
+                  'phone_2',)
         read_only_fields = ('id',)
         extra_kwargs = {
             'user': {'write_only': True}
@@ -37,12 +42,19 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class BestOfferSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BestOffer
+        fields = ('info_product', 'shop', 'price', 'quantity', 'offers',)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     category = serializers.StringRelatedField()
+    best_offer = BestOfferSerializer(read_only=True)
 
     class Meta:
         model = Product
-        fields = ('name', 'category',)
+        fields = ('name', 'category', 'best_offer',)
 
 
 class ProductParameterSerializer(serializers.ModelSerializer):
@@ -56,6 +68,7 @@ class ProductParameterSerializer(serializers.ModelSerializer):
 class ProductInfoSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_parameters = ProductParameterSerializer(read_only=True, many=True)
+    price_rrc = serializers.IntegerField(source='suggested_retail_price', read_only=True)
 
     class Meta:
         model = InfoProduct
@@ -66,7 +79,7 @@ class ProductInfoSerializer(serializers.ModelSerializer):
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
-        fields = ('id', 'product_info', 'quantity', 'order')
+        fields = ('id', 'info_product', 'quantity', 'order')
         read_only_fields = ('id',)
         extra_kwargs = {
             'order': {'write_only': True}
@@ -74,16 +87,80 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 
 class OrderItemCreateSerializer(OrderItemSerializer):
-    product_info = ProductInfoSerializer(read_only=True)
+    info_product = ProductInfoSerializer(read_only=True)
 
 
 class OrderSerializer(serializers.ModelSerializer):
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
 
-    total_sum = serializers.IntegerField()
     contact = ContactSerializer(read_only=True)
 
     class Meta:
         model = Order
-        fields = ('id', 'ordered_items', 'status', 'dt', 'total_sum', 'contact',)
-        read_only_fields = ('id',)
+        fields = ('id', 'ordered_items', 'status', 'data_time', 'total_sum', 'total_quantity', 'items_count',
+                  'contact',)
+        read_only_fields = ('id', 'total_sum', 'total_quantity', 'items_count',)
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ('id', 'info_product_id', 'shop_id', 'name', 'model', 'quantity', 'price', 'total_cost',)
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    ordered_items = ArchivedOrderItemSerializer(read_only=True, many=True)
+    contact = ContactSerializer(read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ('id', 'ordered_items', 'status', 'data_time', 'total_sum', 'total_quantity', 'items_count',
+                  'contact', 'archived_at',)
+        read_only_fields = fields
+
+
+class PartnerOrderSerializer(OrderSerializer):
+    """заказ глазами магазина: итоги только по его позициям"""
+    total_sum = serializers.IntegerField(source='shop_sum')
+    total_quantity = serializers.IntegerField(source='shop_quantity')
+
+    class Meta(OrderSerializer.Meta):
+        fields = ('id', 'ordered_items', 'status', 'data_time', 'total_sum', 'total_quantity', 'contact',)
+
+
+class PartnerFeedItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'info_product', 'quantity', 'price', 'total_cost',)
+
+
+class PartnerFeedSerializer(serializers.ModelSerializer):
+    """заказ в ленте магазина: только его позиции, без данных каталога"""
+    ordered_items = PartnerFeedItemSerializer(read_only=True, many=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'status', 'updated_at', 'contact', 'ordered_items',)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    processed = serializers.SerializerMethodField()
+    throughput = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'status', 'mode', 'parallel', 'processed', 'throughput', 'result', 'errors',
+                  'created_at', 'started_at', 'finished_at',)
+        read_only_fields = fields
+
+    def get_processed(self, obj):
+        if obj.status == 'running':
+            return cache.get(progress_key(obj.id), obj.processed)
+        return obj.processed
+
+    def get_throughput(self, obj):
+        """товаров в секунду"""
+        if not obj.started_at:
+            return None
+        seconds = ((obj.finished_at or timezone.now()) - obj.started_at).total_seconds()
+        return round(self.get_processed(obj) / seconds, 1) if seconds > 0 else None
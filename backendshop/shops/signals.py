@@ -1,18 +1,16 @@
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
 
-from .models import ConfirmEmailToken, User
+from .authentication import invalidate_tokens, invalidate_user_tokens
+from .events import notify_orders
+from .mail import queue_email
+from .models import ConfirmEmailToken, LoginToken, Order, User
+from .notifications import notify_status_changes
 
+new_user_registered = Signal()
 
-from .tasks import send_email
-
-new_user_registered = Signal(
-    providing_args=['user_id'],
-)
-
-new_order = Signal(
-    providing_args=['user_id'],
-)
+new_order = Signal()
 
 
 @receiver(reset_password_token_created)
@@ -23,8 +21,8 @@ def password_reset_token_created(sender, instance, reset_password_token, **kwarg
     """
 
     message = f'Token {reset_password_token.key}'
-    email = reset_password_token.user
-    send_email(message, email)
+    email = reset_password_token.user.email
+    queue_email('Сброс пароля', message, email)
 
 
 @receiver(new_user_registered)
@@ -36,17 +34,44 @@ def new_user_registered_signal(user_id, **kwargs):
     token, _ = ConfirmEmailToken.objects.get_or_create(user_id=user_id)
     message = token.key
     email = token.user.email
-    send_email(message, email)
+    queue_email('Подтверждение почты', message, email)
 
 
 @receiver(new_order)
-def new_order_signal(user_id, **kwargs):
+def new_order_signal(user_id, order_id=None, **kwargs):
     """
-    отправяем письмо при изменении статуса заказа
+    изменение статуса заказа попадает в письмо-сводку пользователю
     """
-    # send an e-mail to the user
-    user = User.objects.get(id=user_id)
-    title = "Обновление статуса заказа"
-    message = 'Заказ сформирован'
-    email = user.email
-    send_email.apply_async((title, message, email), countdown=5 * 60)
+    if order_id is None:
+        user = User.objects.get(id=user_id)
+        queue_email("Обновление статуса заказа", 'Заказ сформирован', user.email, delay=5 * 60)
+    else:
+        notify_status_changes([order_id])
+
+
+@receiver(post_save, sender=Order)
+def order_saved_signal(instance, **kwargs):
+    """
+    публикуем статус заказа в push-канал и в письмо-сводку после коммита
+    """
+    if instance.status != 'basket':
+        notify_orders([instance.id])
+        notify_status_changes([instance.id])
+
+
+@receiver(post_save, sender=LoginToken)
+@receiver(post_delete, sender=LoginToken)
+def token_changed_signal(instance, **kwargs):
+    """
+    удалённый токен больше не принимается из кэша
+    """
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed_signal(instance, **kwargs):
+    """
+    после смены пароля, активности или типа пользователя сбрасываем кэш его токенов
+    """
+    invalidate_user_tokens(instance.id)
@@ -1,65 +1,230 @@
-import yaml
+import json
+import os
+import shutil
+from contextlib import contextmanager
 
-from django.conf.global_settings import EMAIL_HOST_USER
-from django.core.mail.message import EmailMultiAlternatives
+from celery import chord
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
 
 from backendshop.celery import app
 
-from .models import Category, Parameter, ProductParameter, Product, Shop
+from .archive import archive_orders
+from .cache import bump_catalog_versions
+from .importer import DEFAULT_SHARD_SIZE, PriceListImporter, discard_catalog_version, get_format, \
+    iter_price_list, progress_key, purge_catalog_versions
+from .mail import drain_outbox, queue_email
+from .models import ImportJob, Shop
+from .notifications import send_digest
+from .offers import refresh_shop_offers
+from .reservations import release_expired_reservations
+from .tokens import purge_expired_tokens
+
+PROGRESS_TIMEOUT = 24 * 60 * 60
 
 
 @app.task()
 def send_email(message: str, email: str, *args, **kwargs) -> str:
+    """письмо ставится в очередь, отправляет его drain_email_outbox"""
     title = 'Title'
-    email_list = list()
-    email_list.append(email)
+    queue_email(title, message, email)
+    return f'Title: {title}, Message:{message}'
+
+
+@app.task()
+def drain_email_outbox():
+    return drain_outbox()
+
+
+@app.task()
+def send_order_digest(user_id):
+    return send_digest(user_id)
+
+
+@app.task()
+def purge_tokens():
+    """периодическая задача: удаляем просроченные токены"""
+    return purge_expired_tokens()
+
+
+@contextmanager
+def open_file(file):
+    """открываем прайс в бинарном режиме, загруженный файл используем как есть"""
+    if hasattr(file, 'read'):
+        file.seek(0)
+        yield file
+    else:
+        with open(file, 'rb') as f:
+            yield f
+
+
+@app.task()
+def import_shop_data(data, user_id, mode='sync'):
+    with open_file(data) as stream:
+        result = PriceListImporter(user_id, mode=mode).run(iter_price_list(stream, get_format(data)))
+    if mode == 'replace':
+        purge_catalog.delay(result['shop'])
+    return result
+
+
+@app.task()
+def purge_catalog(shop_id):
+    return purge_catalog_versions(shop_id)
+
+
+@app.task()
+def release_reservations():
+    """периодическая задача: возвращаем товар из просроченных резервов"""
+    return release_expired_reservations()
+
+
+@app.task()
+def archive_old_orders():
+    """периодическая задача: переносим завершённые заказы в архив"""
+    return archive_orders()
+
+
+@app.task()
+def refresh_shop_best_offers(shop_id):
+    """после смены статуса магазина: пересчёт лучших предложений, затем сброс кэша затронутых страниц"""
+    with transaction.atomic():
+        shop_ids = refresh_shop_offers(shop_id) | {shop_id}
+        transaction.on_commit(lambda: bump_catalog_versions(shop_ids))
+    return len(shop_ids)
+
+
+def shard_folder(job_id):
+    return os.path.join(settings.STORAGE, 'imports', f'job-{job_id}')
+
+
+def finish_job(job, result=None, error=None):
+    job.finished_at = timezone.now()
+    if error is None:
+        job.status = 'done'
+        job.result = result
+        job.processed = result['goods']
+    else:
+        job.status = 'failed'
+        job.errors = str(error)
+    job.save()
+    cache.delete(progress_key(job.id))
+    shutil.rmtree(shard_folder(job.id), ignore_errors=True)
+    if os.path.exists(job.file):
+        os.remove(job.file)
+    return job.status
+
+
+@app.task()
+def run_import_job(job_id):
+    """
+    загрузка прайса из очереди: статус пишем в ImportJob,
+    а текущий прогресс - в кэш, так как загрузка идёт в одной транзакции
+    """
+    job = ImportJob.objects.get(id=job_id)
+    job.status = 'running'
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    def progress(processed):
+        cache.set(progress_key(job.id), processed, PROGRESS_TIMEOUT)
+
     try:
-        msg = EmailMultiAlternatives(subject=title, body=message, from_email=EMAIL_HOST_USER, to=email_list)
-        msg.send()
-        return f'Title: {msg.subject}, Message:{msg.body}'
-    except Exception as e:
-        raise e
+        with open_file(job.file) as stream:
+            rows = iter_price_list(stream, get_format(job.file))
+            if job.parallel:
+                return split_import_job(job, rows)
+            result = PriceListImporter(job.user_id, mode=job.mode, progress=progress).run(rows)
+    except Exception as error:
+        return finish_job(job, error=error)
+    if job.mode == 'replace':
+        purge_catalog.delay(result['shop'])
+    return finish_job(job, result)
 
 
-def open_file(shop):
-    with open(shop.get_file(), 'r') as f:
-        data = yaml.safe_load(f)
-    return data
+def split_import_job(job, rows):
+    """
+    делим товары прайса на шарды по IMPORT_SHARD_SIZE и раздаём их воркерам;
+    шарды пишут товары в новую версию каталога, finish_import публикует её
+    после завершения всех шардов
+    """
+    importer = PriceListImporter(job.user_id, mode='replace')
+    folder = shard_folder(job.id)
+    os.makedirs(folder, exist_ok=True)
+    size = getattr(settings, 'IMPORT_SHARD_SIZE', DEFAULT_SHARD_SIZE)
+    paths = []
+    items = []
+
+    def dump():
+        path = os.path.join(folder, f'{len(paths)}.json')
+        with open(path, 'w') as f:
+            json.dump(items, f)
+        paths.append(path)
+
+    for key, value in rows:
+        if key == 'shop':
+            importer.load_shop(value)
+        elif key == 'categories':
+            importer.load_categories(value or [])
+        elif key == 'goods' and value:
+            items.append(value)
+            if len(items) >= size:
+                dump()
+                items = []
+    if items:
+        dump()
+    if importer.shop is None:
+        # раздел shop может идти после goods или отсутствовать - как в обычной загрузке
+        shop = Shop.objects.filter(user_id=job.user_id).first()
+        if shop is None:
+            raise ValueError('В прайс-листе не указан магазин перед списком товаров')
+        importer.load_shop(shop.name)
+
+    shop_id, version = importer.shop.id, importer.version
+    categories = list(importer.categories.items())
+    cache.set(progress_key(job.id), 0, PROGRESS_TIMEOUT)
+    callback = finish_import.s(job.id, shop_id, version).on_error(fail_import.s(job.id, shop_id, version))
+    try:
+        if paths:
+            chord(import_shard.s(job.id, path, shop_id, version, categories) for path in paths)(callback)
+        else:
+            callback.delay([])
+    except Exception:
+        # задачи не отправились или выполнились здесь же с ошибкой - версия не будет опубликована
+        discard_catalog_version(shop_id, version)
+        raise
+    return job.status
+
+
+@app.task()
+def import_shard(job_id, path, shop_id, version, categories):
+    job = ImportJob.objects.get(id=job_id)
+    with open(path) as f:
+        items = json.load(f)
+    count = PriceListImporter(job.user_id, mode='replace').import_shard(shop_id, version, categories, items)
+    os.remove(path)
+    try:
+        cache.incr(progress_key(job.id), count)
+    except ValueError:
+        pass
+    return count
+
+
+@app.task()
+def finish_import(results, job_id, shop_id, version):
+    job = ImportJob.objects.get(id=job_id)
+    try:
+        result = PriceListImporter(job.user_id, mode='replace').publish_version(shop_id, version)
+    except Exception as error:
+        discard_catalog_version(shop_id, version)
+        return finish_job(job, error=error)
+    purge_catalog.delay(shop_id)
+    return finish_job(job, result)
 
 
 @app.task()
-def import_shop_data(data, user_id):
-    file = open_file(data)
-
-    shop, _ = Shop.objects.get_or_create(user_id=user_id,
-                                         defaults={'name': file['shop']})
-
-    load_cat = [
-        Category(id=category['id'], name=category['name']) for category in file['categories']
-    ]
-    Category.objects.bulk_create(load_cat)
-
-    Product.objects.filter(shop_id=shop.id).delete()
-
-    load_prod = []
-    product_id = {}
-    load_pp = []
-    for item in file['goods']:
-        load_prod.append(Product(name=item['name'],
-                                 category_id=item['category'],
-                                 model=item['model'],
-                                 external_id=item['id'],
-                                 shop_id=shop.id,
-                                 quantity=item['quantity'],
-                                 price=item['price'],
-                                 price_rrc=item['price_rrc']))
-        product_id[item['id']] = {}
-
-        for name, value in item['parameters'].items():
-            parameter, _ = Parameter.objects.get_or_create(name=name)
-            product_id[item['id']].update({parameter.id: value})
-            load_pp.append(ProductParameter(product_id=product_id[item['id']][parameter.id],
-                                            parameter_id=parameter.id,
-                                            value=value))
-    Product.objects.bulk_create(load_prod)
-    ProductParameter.objects.bulk_create(load_pp)
+def fail_import(request, exc, traceback, job_id, shop_id, version):
+    job = ImportJob.objects.get(id=job_id)
+    discard_catalog_version(shop_id, version)
+    return finish_job(job, error=exc)
@@ -0,0 +1,69 @@
+"""
+Сроки действия токенов входа, подтверждения почты и сброса пароля.
+
+Токен входа действует AUTH_TOKEN_TTL секунд с момента выдачи и может быть
+заменён новым (ротация). Просроченные токены всех трёх видов удаляет
+периодическая задача пачками по TOKEN_PURGE_BATCH_SIZE, выборка идёт по
+индексу на дате создания.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django_rest_passwordreset.models import ResetPasswordToken, get_password_reset_token_expiry_time
+
+from .models import ConfirmEmailToken, LoginToken
+
+DEFAULT_AUTH_TOKEN_TTL = 30 * 24 * 60 * 60
+DEFAULT_CONFIRM_EMAIL_TOKEN_TTL = 24 * 60 * 60
+DEFAULT_TOKEN_PURGE_BATCH_SIZE = 1000
+
+
+def get_auth_token_ttl():
+    return timedelta(seconds=getattr(settings, 'AUTH_TOKEN_TTL', DEFAULT_AUTH_TOKEN_TTL))
+
+
+def get_confirm_email_token_ttl():
+    return timedelta(seconds=getattr(settings, 'CONFIRM_EMAIL_TOKEN_TTL', DEFAULT_CONFIRM_EMAIL_TOKEN_TTL))
+
+
+def get_expires(created):
+    return created + get_auth_token_ttl()
+
+
+def issue_token(user):
+    return LoginToken.objects.create(user=user)
+
+
+def rotate_token(key):
+    """заменяем действующий токен новым, старый сразу перестаёт действовать"""
+    with transaction.atomic():
+        token = LoginToken.objects.select_for_update().filter(key=key).first()
+        if token is None:
+            return None
+        token.delete()
+        return LoginToken.objects.create(user_id=token.user_id)
+
+
+def delete_batched(queryset, field, expired_before, batch_size):
+    """удаляем строки старше expired_before пачками, каждая пачка - отдельный DELETE"""
+    deleted = 0
+    while True:
+        keys = list(queryset.filter(**{f'{field}__lte': expired_before}).order_by(field).values_list(
+            'pk', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += queryset.filter(pk__in=keys).delete()[0]
+
+
+def purge_expired_tokens(batch_size=None):
+    batch_size = batch_size or getattr(settings, 'TOKEN_PURGE_BATCH_SIZE', DEFAULT_TOKEN_PURGE_BATCH_SIZE)
+    now = timezone.now()
+    return {
+        'login': delete_batched(LoginToken.objects.all(), 'created', now - get_auth_token_ttl(), batch_size),
+        'confirm_email': delete_batched(ConfirmEmailToken.objects.all(), 'created_at',
+                                        now - get_confirm_email_token_ttl(), batch_size),
+        'password_reset': delete_batched(ResetPasswordToken.objects.all(), 'created_at',
+                                         now - timedelta(hours=get_password_reset_token_expiry_time()), batch_size),
+    }
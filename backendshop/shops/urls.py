@@ -4,7 +4,8 @@ from rest_framework import routers
 from rest_framework.urlpatterns import format_suffix_patterns
 
 from .views import ShopView, CategoryView, PartnerUpdate, BasketView, ContactView, PartnerOrders, OrderView, \
-    AccountRegister, AccountConfirm, AccountLogin, DetailsAccount, PartherState, InfoProductView
+    AccountRegister, AccountConfirm, AccountLogin, DetailsAccount, PartherState, InfoProductView, PartnerImportJob, \
+    OrderEvents, TokenRotate, CatalogExport
 
 app_name = 'shops'
 
@@ -15,6 +16,7 @@ router.register(r'products', InfoProductView, basename='products')
 
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/import/<int:pk>', PartnerImportJob.as_view(), name='partner-import'),
     path('partner/state', PartherState.as_view(), name='partner-state'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
     path('user/register', AccountRegister.as_view(), name='user-register'),
@@ -22,10 +24,13 @@ urlpatterns = [
     path('user/details', DetailsAccount.as_view(), name='user-details'),
     path('user/contact', ContactView.as_view(), name='user-contact'),
     path('user/login', AccountLogin.as_view(), name='user-login'),
+    path('user/token/rotate', TokenRotate.as_view(), name='user-token-rotate'),
     path('user/password_reset', reset_password_request_token, name='password-reset'),
     path('user/password_reset/confirm', reset_password_confirm, name='password-reset-confirm'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
+    path('order/events', OrderEvents.as_view(), name='order-events'),
+    path('catalog/export', CatalogExport.as_view(), name='catalog-export'),
     path('', include(router.urls)),
     path('social-auth/',include('social_django.urls', namespace='social')),
 ]
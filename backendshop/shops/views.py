@@ -1,22 +1,49 @@
+import asyncio
+import json
 from distutils.util import strtobool
 
-from django.conf import settings
+from asgiref.sync import sync_to_async
+
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F, Prefetch
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.text import compress_sequence
+from django.views import View
 from rest_framework import status, viewsets
-from rest_framework.authtoken.models import Token
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from ujson import loads as load_json
 
 
-from shops.models import Category, Shop, InfoProduct, Order, OrderItem, ConfirmEmailToken, Contact
+from shops.models import Category, Shop, InfoProduct, ConfirmEmailToken, Contact, ImportJob
 from shops.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductInfoSerializer, \
-    OrderSerializer, OrderItemSerializer, ContactSerializer
-from shops.tasks import import_shop_data
+    OrderSerializer, ContactSerializer, ImportJobSerializer, PartnerOrderSerializer, \
+    PartnerFeedSerializer, ArchivedOrderSerializer
+from shops.authentication import CachedTokenAuthentication
+from shops.basket import add_items, delete_items, get_basket, update_items
+from shops.checkout import CheckoutError, checkout
+from shops.catalog import PAGE_FIELDS, render_page
+from shops.cache import bump_catalog_version, catalog_page_key, get_catalog_timeout
+from shops.export import EXPORT_FORMATS, export_csv, export_ndjson, export_yaml, get_export_offers, \
+    get_last_modified
+from shops.events import get_event_broker, user_channel
+from shops.feed import get_partner_feed
+from shops.importer import IMPORT_MODES, save_upload
+from shops.orders import get_archived_orders, get_basket_orders, get_partner_orders, get_user_orders
+from shops.reservations import confirm_order
+from shops.search import get_facets, search_offers
+from shops.tokens import get_confirm_email_token_ttl, get_expires, issue_token, rotate_token
+from shops.pagination import CatalogPagination, CatalogKeysetPagination, KeysetPagination
+from shops.tasks import run_import_job, refresh_shop_best_offers
 
 
 class AccountRegister(APIView):
@@ -53,8 +80,9 @@ class AccountConfirm(APIView):
 
     def post(self, request, *args, **kwargs):
         if {'email', 'token'}.issubset(request.data):
-            token = ConfirmEmailToken.objects.fiter(user__email=request.data['email'],
-                                                    key=request.data['token']).first()
+            token = ConfirmEmailToken.objects.filter(
+                user__email=request.data['email'], key=request.data['token'],
+                created_at__gt=timezone.now() - get_confirm_email_token_ttl()).first()
             if token:
                 token.user.is_active = True
                 token.user.save()
@@ -77,14 +105,28 @@ class AccountLogin(APIView):
 
             if user is not None:
                 if user.is_active:
-                    token, _ = Token.objects.get_or_create(user=user)
-                    return Response({'Status': True, 'Token': token.key})
+                    token = issue_token(user)
+                    return Response({'Status': True, 'Token': token.key, 'Expires': get_expires(token.created)})
             return Response({'Status': False, 'Errors': 'Ошибка авторизации'},
                             status=status.HTTP_403_FORBIDDEN)
         return Response({'Status': False, 'Errors': 'Не указаны необходимые данные'},
                         status=status.HTTP_400_BAD_REQUEST)
 
 
+class TokenRotate(APIView):
+    """замена токена входа новым, текущий перестаёт действовать"""
+    throttle_scope = 'user'
+
+    def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated or not isinstance(request.auth, str):
+            return Response({'Status': False, 'Error': 'Требуется вход по токену'},
+                            status=status.HTTP_403_FORBIDDEN)
+        token = rotate_token(request.auth)
+        if token is None:
+            return Response({'Status': False, 'Error': 'Токен уже заменён'}, status=status.HTTP_409_CONFLICT)
+        return Response({'Status': True, 'Token': token.key, 'Expires': get_expires(token.created)})
+
+
 class DetailsAccount(APIView):
     """работа с данными пользователей"""
     throttle_scope = 'user'
@@ -137,10 +179,12 @@ class InfoProductView(viewsets.ReadOnlyModelViewSet):
     """поиск товаров"""
     throttle_scope = 'anon'
     serializer_class = ProductInfoSerializer
-    ordering = ('product',)
+    pagination_class = CatalogPagination
+    ordering = ('id',)
 
-    def get_queryset(self):
-        query = Q(shop__state=True)
+    def get_offers(self):
+        # показываем только опубликованную версию каталога магазина
+        query = Q(shop__status=True) & Q(version=F('shop__catalog_version'))
         shop_id = self.request.query_params.get('shop_id')
         category_id = self.request.query_params.get('category_id')
 
@@ -151,10 +195,117 @@ class InfoProductView(viewsets.ReadOnlyModelViewSet):
             query = query & Q(product__category_id=category_id)
 
         # фильтруем и отбрасываем дубликаты
-        queryset = not InfoProduct.objects.filter(query).select_related(
-            'shop', 'product__category').prefetch_related(
-            'product_parameters__parameter').distinct()
-        return queryset
+        return InfoProduct.objects.filter(query).distinct().order_by(*self.ordering)
+
+    def get_queryset(self):
+        return self.get_offers().select_related(
+            'shop', 'product__category', 'product__best_offer').prefetch_related('product_parameters__parameter')
+
+    def fast_json(self, request):
+        """JSON без сериализаторов DRF, для остальных форматов - обычный вывод"""
+        return request.accepted_renderer.format == 'json'
+
+    def render_page(self, queryset, **extra):
+        """страница каталога одной строкой JSON из кэшированных фрагментов предложений"""
+        page = self.paginate_queryset(queryset.values(*PAGE_FIELDS))
+        envelope = self.get_paginated_response([]).data
+        del envelope['results']
+        envelope.update(extra)
+        return render_page(envelope, page)
+
+    def list(self, request, *args, **kwargs):
+        """страницы каталога отдаём из кэша, пока не сменится версия каталога"""
+        if CatalogKeysetPagination.requested(request):
+            page = 'cursor:' + request.query_params[CatalogKeysetPagination.cursor_query_param]
+        else:
+            page = request.query_params.get(self.paginator.page_query_param, 1)
+        page = f'{page}:{request.accepted_renderer.format}'
+        key = catalog_page_key(request.query_params.get('shop_id'), request.query_params.get('category_id'), page)
+        data = cache.get(key)
+        if data is None and self.fast_json(request):
+            data = self.render_page(self.get_offers())
+            cache.set(key, data, get_catalog_timeout())
+        elif data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, get_catalog_timeout())
+        if isinstance(data, str):
+            return HttpResponse(data, content_type='application/json')
+        return Response(data)
+
+    @action(detail=False)
+    def search(self, request, *args, **kwargs):
+        """
+        полнотекстовый поиск: q - текст, price_min/price_max - цена,
+        parameter=название:значение - фильтр по параметру (можно несколько)
+        """
+        try:
+            price_min = request.query_params.get('price_min')
+            price_min = int(price_min) if price_min else None
+            price_max = request.query_params.get('price_max')
+            price_max = int(price_max) if price_max else None
+        except ValueError:
+            return Response({'Status': False, 'Error': 'Неверно указана цена'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        parameters = [item.split(':', 1) for item in request.query_params.getlist('parameter') if ':' in item]
+
+        queryset = search_offers(self.get_offers(), request.query_params.get('q'), price_min, price_max,
+                                 parameters)
+        if self.fast_json(request):
+            return HttpResponse(self.render_page(queryset, facets=get_facets(queryset)),
+                                content_type='application/json')
+        queryset = queryset.select_related('shop', 'product__category', 'product__best_offer').prefetch_related(
+            'product_parameters__parameter')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.data['facets'] = get_facets(queryset)
+        return response
+
+
+class CatalogExport(APIView):
+    """
+    выгрузка всего опубликованного каталога потоком: type=ndjson|csv|yaml,
+    shop_id - один магазин (для yaml обязателен), сжатие gzip по Accept-Encoding,
+    If-Modified-Since сравнивается со временем последней загрузки прайса
+    """
+    throttle_scope = 'export'
+
+    def get(self, request, *args, **kwargs):
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in EXPORT_FORMATS:
+            return Response({'Status': False, 'Error': f'Формат выгрузки: {", ".join(EXPORT_FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        shop_id = request.query_params.get('shop_id')
+        if shop_id and not shop_id.isdigit():
+            return Response({'Status': False, 'Error': 'Неверно указан магазин'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        offers = get_export_offers(shop_id)
+        if export_type == 'yaml':
+            shop_name = Shop.objects.filter(id=shop_id, status=True).values_list('name', flat=True).first() \
+                if shop_id else None
+            if shop_name is None:
+                return Response({'Status': False, 'Error': 'Для yaml укажите shop_id активного магазина'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            content = export_yaml(offers, shop_name)
+        elif export_type == 'csv':
+            content = export_csv(offers)
+        else:
+            content = export_ndjson(offers)
+
+        response = StreamingHttpResponse(content_type=EXPORT_FORMATS[export_type])
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if re_accepts_gzip.search(request.headers.get('Accept-Encoding', '')):
+            content = compress_sequence(chunk.encode() for chunk in content)
+            response.headers['Content-Encoding'] = 'gzip'
+        response.streaming_content = content
+        response.headers['Content-Disposition'] = f'attachment; filename="catalog.{export_type}"'
+
+        last_modified = get_last_modified(shop_id)
+        if last_modified is None:
+            return response
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+        return get_conditional_response(request, last_modified=int(last_modified.timestamp()), response=response)
 
 class BasketView(APIView):
     """работа с корзиной пользователя"""
@@ -166,41 +317,28 @@ class BasketView(APIView):
         if not request.user.is_authenticated:
             return JsonResponse({'Status':False, 'Error': 'Требуется вход в систему'},
                                 status=status.HTTP_403_FORBIDDEN)
-        basket = Order.objects.filter(user_id=request.user.id, status='basket').prefetch_related(
-            'ordered_items__product_info__product_category',
-            'ordered_items__product_info__product_parameters__parameter').annotate(
-            total_sum=Sum(F('ordered_items__quantity') * F('ordered_items__product_info__price'))).distinct()
+        basket = get_basket_orders(request.user.id)
 
         serializer = OrderSerializer(basket, many=True)
         return Response(serializer.data)
 
     def post(self, request, *args, **kwargs):
+        """добавление позиций в корзину одним запросом к базе"""
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Требуется вход в систему'},
                                 status=status.HTTP_403_FORBIDDEN)
         items_basket = request.data.get('items')
         if items_basket:
             try:
-                items_dict = load_json(items_basket)
+                items_dict = load_json(items_basket) if isinstance(items_basket, str) else items_basket
             except ValueError:
-                JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
+                return JsonResponse({'Status': False, 'Errors': 'Неверный формат запроса'})
             else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-                objects_created = 0
-                for order_items in items_dict:
-                    order_items.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=order_items)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as error:
-                            return JsonResponse({'Status': False, 'Errors': str(error)})
-                        else:
-                            objects_created += 1
-                    else:
-                        JsonResponse({'Status': False, 'Errors': serializer.errors})
-                return JsonResponse({'Status': True, 'Создано объектов': objects_created})
-            return JsonResponse({'Status': False, 'Errors': 'Не указаны необходимые данные'})
+                basket = get_basket(request.user.id)
+                results = add_items(basket, items_dict)
+                objects_created = sum(result['Status'] for result in results)
+                return JsonResponse({'Status': True, 'Создано объектов': objects_created, 'Items': results})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны необходимые данные'})
 
     def delete(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -208,53 +346,58 @@ class BasketView(APIView):
                                 status=status.HTTP_403_FORBIDDEN)
         items_sting = request.data.get('items')
         if items_sting:
-            item_list = items_sting.split(',')
-            basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-            query = Q()
-            objects_delete = False
-            for order_item_id in item_list:
-                query = query | Q(order_id=basket.id, id=order_item_id)
-                objects_delete = True
-            if objects_delete:
-                delete_count = OrderItem.objects.filter(query).delete()[0]
+            item_list = [order_item_id for order_item_id in items_sting.split(',') if order_item_id.isdigit()]
+            if item_list:
+                delete_count = delete_items(get_basket(request.user.id), item_list)
                 return JsonResponse({'Status': True, 'Удалено объектов': delete_count})
-            return JsonResponse({'Status': False, 'Error': 'Не указаны необходимые данные'})
+        return JsonResponse({'Status': False, 'Error': 'Не указаны необходимые данные'})
 
     def put(self, request, *args, **kwargs):
+        """изменение количества в позициях корзины одним UPDATE"""
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Требуется вход в систему'},
                                 status=status.HTTP_403_FORBIDDEN)
         items_posit = request.data.get('items')
         if items_posit:
             try:
-                items_dict = load_json(items_posit)
+                items_dict = load_json(items_posit) if isinstance(items_posit, str) else items_posit
             except ValueError:
-                JsonResponse({'Status': False, 'Error': 'Не верный формат запроса'})
+                return JsonResponse({'Status': False, 'Error': 'Не верный формат запроса'})
             else:
-                basket, _ = Order.objects.get_or_create(user_id=request.user.id, state='basket')
-                objects_update = 0
-                for order_item in items_dict:
-                    if type(order_item['id']) == int and type(order_item['quantity']) == int:
-                        objects_update += OrderItem.objects.filter(order_id=basket.id,
-                                                                   id=order_item['id']).update(quantity=order_item
-                                                                                              ['quantity'])
-                    return JsonResponse({'Status': True, 'Обновлено объектов': objects_update})
-                return JsonResponse({'Status': False, 'Error': 'Не указаны необходимые данные'})
+                basket = get_basket(request.user.id)
+                results = update_items(basket, items_dict)
+                objects_update = sum(result['Status'] for result in results)
+                return JsonResponse({'Status': True, 'Обновлено объектов': objects_update, 'Items': results})
+        return JsonResponse({'Status': False, 'Error': 'Не указаны необходимые данные'})
+
 
 class OrderView(APIView):
     '''получение и размещение заказов пользователями'''
     throttle_scope = 'user'
 
     def get(self, request, *args, **kwargs):
+        """текущие заказы, с параметром archive=true - перенесённые в архив"""
         if not request.user.is_authenticated:
             return Response({'Status': False, 'Error': 'Требуется вход в систему'},
                             status=status.HTTP_403_FORBIDDEN)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(status='basket').select_related('contact').prefetch_related(
-                'ordered_items').annotate(total_quantity=Sum('ordered_items__quantity'),
-                  total_sum=Sum('ordered_items__total_amount')).dictinct()
-
-        serializer = OrderSerializer(order, many=True)
+        try:
+            archive = strtobool(request.query_params.get('archive', 'false'))
+        except ValueError:
+            return Response({'Status': False, 'Error': 'Неверно указан параметр archive'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if archive:
+            order = get_archived_orders(request.user.id)
+            serializer_class = ArchivedOrderSerializer
+        else:
+            order = get_user_orders(request.user.id)
+            serializer_class = OrderSerializer
+
+        paginator = KeysetPagination()
+        if paginator.requested(request):
+            page = paginator.paginate_queryset(order, request, view=self)
+            serializer = serializer_class(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = serializer_class(order, many=True)
         return Response(serializer.data)
 
     def post(self, request, *args, **kwargs):
@@ -263,21 +406,22 @@ class OrderView(APIView):
         if not request.user.is_authenticated:
             return Response({'Status': False, 'Error': 'Требуется вход в систему'},
                             status=status.HTTP_403_FORBIDDEN)
-        if request.data['id'].isdigit():
+        order_id, contact_id = request.data.get('id'), request.data.get('contact')
+        if str(order_id).isdigit() and str(contact_id).isdigit():
+            key = request.headers.get('Idempotency-Key') or request.data.get('key')
             try:
-                is_update = Order.objects.filter(id=request.data['id'], user_id=request.user.id).update(
-                    contact_id=request.data['contact'], status='new')
-            except IntegrityError as error:
-                return Response({'Status': False, 'Error': 'Неправильно указаны необходимые данные'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            else:
-                if is_update:
-                    request.user.email_user(f'Обновление статуса заказа','Заказ сформирован',
-                                            from_email=settings.EMAIL_HOST_USER)
-                    return Response({'Status': True})
+                order, _ = checkout(request.user.id, int(order_id), int(contact_id), key)
+            except CheckoutError as error:
+                return Response({'Status': False, 'Error': error.message, 'Items': error.items},
+                                status=status.HTTP_409_CONFLICT if error.items else status.HTTP_400_BAD_REQUEST)
+            except IntegrityError:
+                return Response({'Status': False, 'Error': 'Ключ уже использован для другого заказа'},
+                                status=status.HTTP_409_CONFLICT)
+            return Response({'Status': True, 'Order': order.id})
         return Response({'Status': False, 'Error': 'Не указаны необходимые данные'},
                         status=status.HTTP_400_BAD_REQUEST)
 
+
 class ContactView(APIView):
     '''работа с контактами покупателей'''
 
@@ -355,16 +499,42 @@ class PartnerOrders(APIView):
             return Response({'Status': False, 'Error': 'Только для магазинов'},
                             status=status.HTTP_403_FORBIDDEN)
 
-        pr = Prefetch('ordered_items', queryset=OrderItem.objects.filter(shop__user_id=request.user.id))
-        order = Order.objects.filter(
-            ordered_items__shop__user_id=request.user.id).exclude(status='basket') \
-            .prefetch_related(pr).select_related('contact').annotate(
-            total_sum=Sum('ordered_items__total_amount'),
-            total_quantity=Sum('ordered_items__quantity'))
-
-        serializer = OrderSerializer(order, many=True)
+        if 'since' in request.query_params:
+            try:
+                orders, since, more = get_partner_feed(request.user.id, request.query_params['since'])
+            except ValueError as error:
+                return Response({'Status': False, 'Error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+            serializer = PartnerFeedSerializer(orders, many=True)
+            return Response({'results': serializer.data, 'since': since, 'more': more})
+
+        order = get_partner_orders(request.user.id)
+
+        paginator = KeysetPagination()
+        if paginator.requested(request):
+            page = paginator.paginate_queryset(order, request, view=self)
+            serializer = PartnerOrderSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = PartnerOrderSerializer(order, many=True)
         return Response(serializer.data)
 
+    def post(self, request, *args, **kwargs):
+        """подтверждение нового заказа с позициями магазина, до истечения резерва"""
+        if not request.user.is_authenticated:
+            return Response({'Status': False, 'Error': 'Требуется вход в систему'},
+                            status=status.HTTP_403_FORBIDDEN)
+        if request.user.type != 'shop':
+            return Response({'Status': False, 'Error': 'Только для магазинов'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        order_id = request.data.get('id')
+        if not str(order_id).isdigit():
+            return Response({'Status': False, 'Error': 'Не указаны необходимые данные'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not confirm_order(request.user.id, int(order_id)):
+            return Response({'Status': False, 'Error': 'Новый заказ с товарами магазина не найден'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({'Status': True})
+
 class PartherState(APIView):
     '''работа со статусом поставщика'''
     throttle_scope = 'user'
@@ -393,7 +563,13 @@ class PartherState(APIView):
         state = request.data.get('state')
         if state:
             try:
-                Shop.objects.filter(user_id=request.user.id).update(state=strtobool(state))
+                Shop.objects.filter(user_id=request.user.id).update(status=strtobool(state),
+                                                                    catalog_updated_at=timezone.now())
+                for shop_id in Shop.objects.filter(user_id=request.user.id).values_list('id', flat=True):
+                    # предложения магазина сразу пропадают или появляются в каталоге, лучшие
+                    # предложения задача пересчитает и сбросит затронутые страницы ещё раз
+                    bump_catalog_version(shop_id)
+                    refresh_shop_best_offers.delay(shop_id)
                 return Response({'Status': True})
             except ValueError as error:
                 return Response({'Status': False, 'Errors': str(error)}, status=status.HTTP_400_BAD_REQUEST)
@@ -414,17 +590,102 @@ class PartnerUpdate(APIView):
             return Response({'Status': False, 'Error': 'Только для магазинов'},
                             status=status.HTTP_403_FORBIDDEN)
 
-        file = request.FILES
+        file = request.FILES.get('file')
         if file:
             user_id = request.user.id
-            import_shop_data(file, user_id)
+            try:
+                parallel = strtobool(request.data.get('parallel', 'false'))
+            except ValueError as error:
+                return Response({'Status': False, 'Errors': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+            # параллельная загрузка всегда собирает и публикует новую версию каталога
+            mode = request.data.get('mode', 'replace' if parallel else 'sync')
+            if mode not in IMPORT_MODES:
+                return Response({'Status': False, 'Error': 'Неизвестный режим загрузки'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            if parallel and mode != 'replace':
+                return Response({'Status': False, 'Error': 'Параллельная загрузка работает только в режиме replace'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            job = ImportJob.objects.create(user_id=user_id, file=save_upload(file), mode=mode,
+                                           parallel=parallel)
+            transaction.on_commit(lambda: run_import_job.delay(job.id))
 
-            return Response({'Status': True})
+            return Response({'Status': True, 'Job': job.id}, status=status.HTTP_202_ACCEPTED)
 
         return Response({'Status': False, 'Error': 'Не указаны необходимые данные'},
                         status=status.HTTP_400_BAD_REQUEST)
 
 
+class PartnerImportJob(APIView):
+    '''статус загрузки прайса поставщика'''
+    throttle_scope = 'user'
+
+    def get(self, request, pk, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return Response({'Status': False, 'Error': 'Требуется вход в систему'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        if request.user.type != 'shop':
+            return Response({'Status': False, 'Error': 'Только для магазинов'},
+                            status=status.HTTP_403_FORBIDDEN)
 
+        job = ImportJob.objects.filter(id=pk, user_id=request.user.id).first()
+        if not job:
+            return Response({'Status': False, 'Error': 'Загрузка не найдена'},
+                            status=status.HTTP_404_NOT_FOUND)
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data)
 
 
+class OrderEvents(View):
+    """
+    push-канал статусов заказов для покупателей и магазинов (ASGI).
+    По умолчанию поток server-sent events, с mode=poll - long-polling:
+    ответ приходит с первым событием или пустым по истечении timeout.
+    Поток закрывается через stream_lifetime секунд, EventSource переподключается
+    через retry: отключение клиента обработчик ASGI не замечает, и без срока
+    генератор с подпиской на канал жил бы вечно.
+    """
+    keepalive = 15
+    poll_timeout = 25
+    stream_lifetime = 5 * 60
+    retry = 1000
+
+    @staticmethod
+    def get_user(request):
+        try:
+            auth = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        if auth:
+            return auth[0]
+        return request.user if request.user.is_authenticated else None
+
+    async def get(self, request, *args, **kwargs):
+        user = await sync_to_async(self.get_user)(request)
+        if user is None:
+            return JsonResponse({'Status': False, 'Error': 'Требуется вход в систему'},
+                                status=status.HTTP_403_FORBIDDEN)
+        channel = user_channel(user.id)
+        if request.GET.get('mode') == 'poll':
+            timeout = request.GET.get('timeout', '')
+            timeout = min(int(timeout), self.poll_timeout) if timeout.isdigit() else self.poll_timeout
+            async with get_event_broker().subscribe(channel) as get_event:
+                event = await get_event(timeout)
+            return JsonResponse({'Status': True, 'Events': [event] if event else []})
+
+        response = StreamingHttpResponse(self.stream(channel), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, channel):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.stream_lifetime
+        async with get_event_broker().subscribe(channel) as get_event:
+            yield f'retry: {self.retry}\n: connected\n\n'
+            while loop.time() < deadline:
+                event = await get_event(min(self.keepalive, deadline - loop.time()))
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield f'event: order\ndata: {json.dumps(event)}\n\n'